@@ -0,0 +1,65 @@
+"""
+Cancelación cooperativa de renders
+
+El endpoint crea un CancelToken por petición; el procesamiento de imágenes y
+las etapas del PDF lo consultan entre pasos para abandonar el trabajo cuando
+el cliente se desconecta o se vence el plazo de la petición.
+"""
+import threading
+import time
+from typing import Optional
+
+
+class RenderCancelled(Exception):
+    """El render se abandonó por desconexión del cliente o plazo vencido"""
+
+    def __init__(self, reason: str, stage: str = ""):
+        self.reason = reason
+        self.stage = stage
+        super().__init__(f"Render cancelado ({reason}) en etapa '{stage}'")
+
+
+class CancelToken:
+    """Señal de cancelación compartida entre el event loop y el hilo de render"""
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Inicializa el token
+
+        Args:
+            timeout: Segundos disponibles antes de que el plazo venza (None = sin plazo)
+        """
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+
+    def cancel(self, reason: str) -> None:
+        """Marca el render como cancelado (solo cuenta la primera razón)"""
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Segundos restantes hasta el plazo (None = sin plazo)"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self, stage: str) -> None:
+        """
+        Verifica el token entre etapas
+
+        Args:
+            stage: Nombre de la etapa que está por comenzar
+
+        Raises:
+            RenderCancelled: Si el token fue cancelado o el plazo venció
+        """
+        if self.cancelled:
+            raise RenderCancelled(self.reason, stage)
@@ -1,7 +1,9 @@
 """
 Configuración de la aplicación usando Pydantic Settings
 """
-from pydantic import Field
+from typing import Literal, Optional
+
+from pydantic import Field, PositiveInt
 from pydantic_settings import BaseSettings
 
 
@@ -9,6 +11,7 @@ class Settings(BaseSettings):
     """Configuración de la aplicación"""
     
     APP_NAME: str = "PDF Generator Service"
+    APP_VERSION: str = "1.0.0"  # Se registra en el historial de renders
     ENVIRONMENT: str = "production"
     DEBUG: bool = False
     
@@ -16,8 +19,79 @@ class Settings(BaseSettings):
     IMAGE_QUALITY: int = Field(default=85, ge=1, le=100)  # Calidad JPEG (1-100)
     MAX_IMAGE_SIZE_MB: int = Field(default=10, gt=0)  # Tamaño máximo por imagen
     
+    # Fotos casi idénticas (ráfagas): off | flag (marcar en metadata) | drop (descartar)
+    DEDUP_MODE: Literal["off", "flag", "drop"] = "off"
+    DEDUP_SIMILARITY_THRESHOLD: float = Field(default=0.9, ge=0, le=1)  # Bits iguales del hash
+    
     PDF_DPI: int = 96  # DPI para renderizado
+    # Fotos en el PDF: grid (una <img> por foto) | contact_sheet (una imagen compuesta por página)
+    PHOTO_LAYOUT: Literal["grid", "contact_sheet"] = "grid"
+    CONTACT_SHEET_COLUMNS: int = Field(default=3, gt=0)
+    CONTACT_SHEET_ROWS: int = Field(default=4, gt=0)
+    CONTACT_SHEET_WIDTH: int = Field(default=1500, gt=0)  # Ancho de la hoja compuesta (px)
+    RENDER_DEFAULT_PROFILE: str = "final"  # Perfil cuando la petición no indica uno (final | draft)
+    PREVIEW_DPI: int = Field(default=96, gt=0)  # Resolución del PNG de vista previa
+    LAYOUT_CACHE_SECONDS: float = Field(default=120, gt=0)  # Vida del resumen maquetado
+    LAYOUT_CACHE_MAX_ENTRIES: int = Field(default=32, gt=0)
+    PDF_SPOOL_MAX_MEMORY_MB: int = Field(default=8, ge=0)  # PDFs más grandes se escriben a disco
+    FORM_CACHE_SECONDS: int = Field(default=300, ge=0)  # max-age de /form (luego revalida con ETag)
+
+    # Planificador de renderizado (clases de prioridad + cola justa por cliente)
+    RENDER_WORKERS: int = Field(default=2, gt=0)  # Renders simultáneos
+    RENDER_CLASS_SHARES: dict[str, PositiveInt] = {"interactive": 3, "bulk": 1}  # Cuotas de concurrencia (> 0)
+    RENDER_DEFAULT_CLASS: str = "interactive"
+    RENDER_API_KEY_CLASSES: dict[str, str] = {}  # API key -> clase de prioridad
+    RENDER_PRIORITY_HEADER: str = "X-Priority-Class"
+    RENDER_CLIENT_HEADER: str = "X-API-Key"  # Identifica al cliente para la cola justa
+    RENDER_QUEUE_MAX: int = Field(default=100, gt=0)  # Renders en espera por clase antes de responder 429
     
+    # Plazos por petición (el cliente puede pedir otro con el header, hasta el máximo)
+    RENDER_DEADLINE_SECONDS: float = Field(default=55, gt=0)
+    RENDER_DEADLINE_MAX_SECONDS: float = Field(default=300, gt=0)
+    RENDER_DEADLINE_HEADER: str = "X-Request-Timeout"
+
+    # Instrumentación de memoria por etapa (tracemalloc agrega overhead, solo para diagnóstico)
+    MEMORY_PROFILING: bool = False
+    MEMORY_PROFILING_SNAPSHOTS: int = Field(default=5, gt=0)  # Renders recientes con snapshot
+    MEMORY_PROFILING_TOP: int = Field(default=15, gt=0)  # Líneas por snapshot
+    MEMORY_PROFILING_FRAMES: int = Field(default=1, gt=0)  # Profundidad de traceback
+
+    # Historial de rendimiento (SQLite local)
+    HISTORY_ENABLED: bool = True
+    HISTORY_DB_PATH: str = "data/render_history.sqlite3"
+    HISTORY_RETENTION_DAYS: int = Field(default=30, gt=0)
+    HISTORY_MAX_ROWS: int = Field(default=50000, gt=0)
+    HISTORY_BATCH_SIZE: int = Field(default=50, gt=0)  # Renders por escritura
+    HISTORY_FLUSH_SECONDS: float = Field(default=5, gt=0)  # Espera máxima antes de escribir
+    HISTORY_MAX_PENDING: int = Field(default=5000, gt=0)  # Renders en memoria antes de descartar
+    HISTORY_PRUNE_SECONDS: float = Field(default=3600, gt=0)  # Frecuencia de la limpieza
+
+    # Envío de PDFs por email (opcional): cola local durable + conexiones SMTP reutilizadas
+    DELIVERY_ENABLED: bool = False
+    SMTP_HOST: str = "localhost"
+    SMTP_PORT: int = 587
+    SMTP_USER: Optional[str] = None
+    SMTP_PASSWORD: Optional[str] = None
+    SMTP_STARTTLS: bool = True  # STARTTLS tras conectar (puerto 587)
+    SMTP_USE_TLS: bool = False  # TLS implícito (puerto 465)
+    SMTP_TIMEOUT_SECONDS: float = Field(default=30, gt=0)
+    EMAIL_FROM: str = "reportes@localhost"
+    DELIVERY_DB_PATH: str = "data/delivery_queue.sqlite3"
+    DELIVERY_SPOOL_DIR: str = "data/outbox"  # PDFs pendientes de envío
+    DELIVERY_WORKERS: int = Field(default=2, gt=0)  # Conexiones SMTP simultáneas
+    DELIVERY_BATCH_SIZE: int = Field(default=20, gt=0)  # Mensajes por conexión en cada lote
+    DELIVERY_MAX_ATTEMPTS: int = Field(default=6, gt=0)
+    DELIVERY_BACKOFF_SECONDS: float = Field(default=30, gt=0)  # Primer reintento; luego se duplica
+    DELIVERY_BACKOFF_MAX_SECONDS: float = Field(default=3600, gt=0)
+    DELIVERY_POLL_SECONDS: float = Field(default=5, gt=0)  # Revisión de reintentos vencidos
+    DELIVERY_IDLE_SECONDS: float = Field(default=60, gt=0)  # Conexión ociosa se cierra
+    DELIVERY_RETENTION_DAYS: int = Field(default=7, gt=0)  # Estado de envíos terminados
+    DELIVERY_MAX_RECIPIENTS: int = Field(default=10, gt=0)
+    DELIVERY_MAX_PENDING_RENDERS: int = Field(default=20, gt=0)  # Renders aceptados (202) sin terminar
+    # Lease de un lote en envío (y margen sobre RENDER_DEADLINE_MAX_SECONDS para los renders):
+    # vencido, otro proceso o un reinicio retoma el envío. Debe superar lo que tarda un lote
+    DELIVERY_LEASE_SECONDS: float = Field(default=900, gt=0)
+
     CORS_ORIGINS: list[str] = ["*"]
     CORS_ALLOW_CREDENTIALS: bool = False
     
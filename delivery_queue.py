@@ -0,0 +1,482 @@
+"""
+Cola local durable para enviar los PDFs por email
+
+Una petición con email_to responde de inmediato: el envío queda registrado
+en SQLite, el PDF se guarda en DELIVERY_SPOOL_DIR al terminar el render y
+los workers lo envían en segundo plano. Cada worker conserva su conexión
+SMTP entre lotes (se cierra tras DELIVERY_IDLE_SECONDS sin uso) y envía
+hasta DELIVERY_BATCH_SIZE mensajes por conexión. Los errores temporales se
+reintentan con backoff exponencial; los rechazos permanentes (5xx) no.
+
+Estados: rendering -> pending -> sending -> sent | failed
+
+Varios procesos pueden compartir la base: cada envío en rendering o sending
+lleva el proceso dueño y el vencimiento de su lease. Solo se retoman los
+envíos con lease vencido (el proceso que los tenía terminó o quedó colgado),
+nunca los de un proceso vivo: un reinicio los recupera cuando vence su lease.
+"""
+import asyncio
+import json
+import logging
+import random
+import re
+import sqlite3
+import time
+import uuid
+from email.message import EmailMessage
+from pathlib import Path
+from typing import BinaryIO, List, Optional
+
+from config import settings
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+STATUS_RENDERING = "rendering"
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+PRUNE_INTERVAL_SECONDS = 3600
+SPOOL_COPY_CHUNK_BYTES = 1024 * 1024
+# Caracteres de control (CR/LF incluidos) que no pueden ir en un encabezado del mensaje
+HEADER_CONTROL_CHARS = re.compile(r"[\x00-\x1f\x7f]+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    pdf_path TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL,
+    sent_at REAL,
+    last_error TEXT,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS idx_deliveries_due ON deliveries (status, next_attempt_at);
+"""
+# Columnas agregadas después de la primera versión del esquema
+LEASE_COLUMNS = {"owner": "TEXT", "lease_until": "REAL"}
+
+
+class _SMTPSession:
+    """Conexión SMTP de un worker, reutilizada entre lotes"""
+
+    def __init__(self):
+        self._client = None
+        self.last_used = 0.0
+
+    async def send(self, message: EmailMessage) -> dict:
+        """Envía un mensaje abriendo la conexión si hace falta; retorna los destinatarios rechazados"""
+        # Import diferido: aiosmtplib solo es necesario con DELIVERY_ENABLED
+        import aiosmtplib
+
+        if self._client is None or not self._client.is_connected:
+            self._client = aiosmtplib.SMTP(
+                hostname=settings.SMTP_HOST,
+                port=settings.SMTP_PORT,
+                username=settings.SMTP_USER,
+                password=settings.SMTP_PASSWORD,
+                use_tls=settings.SMTP_USE_TLS,
+                start_tls=settings.SMTP_STARTTLS and not settings.SMTP_USE_TLS,
+                timeout=settings.SMTP_TIMEOUT_SECONDS
+            )
+            await self._client.connect()
+            metrics.inc("delivery.connections_opened")
+        refused, _ = await self._client.send_message(message)
+        self.last_used = time.monotonic()
+        return refused
+
+    async def close(self) -> None:
+        if self._client is None:
+            return
+        client, self._client = self._client, None
+        try:
+            if client.is_connected:
+                await client.quit()
+        except Exception:
+            client.close()
+
+
+def _header_text(value: str) -> str:
+    """Reemplaza saltos de línea y caracteres de control por espacios (asunto, nombre del adjunto)"""
+    return " ".join(HEADER_CONTROL_CHARS.sub(" ", value).split())
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Rechazo definitivo del servidor (5xx): reintentar no cambiaría el resultado"""
+    import aiosmtplib
+
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(500 <= r.code < 600 for r in error.recipients)
+    if isinstance(error, aiosmtplib.SMTPAuthenticationError):
+        return False  # Credenciales: se corrigen en config y el reintento puede funcionar
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return 500 <= error.code < 600
+    return False
+
+
+def _server_replied(error: Exception) -> bool:
+    """El servidor respondió con un código: la sesión SMTP sigue siendo utilizable"""
+    import aiosmtplib
+
+    return isinstance(error, (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused))
+
+
+class DeliveryQueue:
+    """Cola durable de envíos por email con workers SMTP"""
+
+    def __init__(self, db_path: str = None, spool_dir: str = None):
+        """
+        Inicializa la cola (la base y el directorio se crean al primer uso)
+
+        Args:
+            db_path: Ruta del archivo SQLite (default: config.DELIVERY_DB_PATH)
+            spool_dir: Directorio de PDFs pendientes (default: config.DELIVERY_SPOOL_DIR)
+        """
+        self.path = Path(db_path or settings.DELIVERY_DB_PATH)
+        self.spool_dir = Path(spool_dir or settings.DELIVERY_SPOOL_DIR)
+        self.enabled = settings.DELIVERY_ENABLED
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._initialized = False
+        self._last_prune = 0.0
+        # Identifica a este proceso como dueño de los envíos que renderiza o envía
+        self.owner = uuid.uuid4().hex
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.executescript(SCHEMA)
+            existing = {row['name'] for row in conn.execute("PRAGMA table_info(deliveries)")}
+            for column, column_type in LEASE_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE deliveries ADD COLUMN {column} {column_type}")
+            self._initialized = True
+        return conn
+
+    # ---- Alta de envíos (llamadas desde los endpoints) ----
+
+    def _insert(self, delivery_id: str, recipients: List[str], subject: str, body: str, filename: str) -> None:
+        now = time.time()
+        conn = self._connect()
+        try:
+            # El render no puede durar más que RENDER_DEADLINE_MAX_SECONDS (reintentos incluidos)
+            conn.execute(
+                "INSERT INTO deliveries (id, created_at, updated_at, status, recipients, subject, body, "
+                "filename, owner, lease_until) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (delivery_id, now, now, STATUS_RENDERING, json.dumps(recipients), subject, body, filename,
+                 self.owner, now + settings.RENDER_DEADLINE_MAX_SECONDS + settings.DELIVERY_LEASE_SECONDS)
+            )
+        finally:
+            conn.close()
+
+    async def create(self, recipients: List[str], subject: str, body: str, filename: str) -> str:
+        """
+        Registra un envío cuyo PDF todavía se está generando
+
+        El asunto y el nombre del adjunto van en encabezados del mensaje: sus
+        saltos de línea y caracteres de control se reemplazan por espacios.
+
+        Args:
+            recipients: Direcciones de destino
+            subject: Asunto del mensaje
+            body: Texto del mensaje
+            filename: Nombre del PDF adjunto
+
+        Returns:
+            ID del envío (para consultar su estado)
+        """
+        delivery_id = uuid.uuid4().hex
+        await asyncio.to_thread(
+            self._insert, delivery_id, recipients, _header_text(subject), body, _header_text(filename)
+        )
+        metrics.inc("delivery.created")
+        return delivery_id
+
+    def _store_pdf(self, delivery_id: str, pdf_file: BinaryIO) -> None:
+        pdf_path = self.spool_dir / f"{delivery_id}.pdf"
+        tmp_path = pdf_path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as out:
+            while chunk := pdf_file.read(SPOOL_COPY_CHUNK_BYTES):
+                out.write(chunk)
+        tmp_path.replace(pdf_path)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE deliveries SET status = ?, pdf_path = ?, next_attempt_at = ?, updated_at = ?, "
+                "owner = NULL, lease_until = NULL WHERE id = ?",
+                (STATUS_PENDING, str(pdf_path), time.time(), time.time(), delivery_id)
+            )
+        finally:
+            conn.close()
+
+    async def attach(self, delivery_id: str, pdf_file: BinaryIO) -> None:
+        """
+        Guarda el PDF generado y deja el envío listo para los workers
+
+        Args:
+            delivery_id: ID retornado por create
+            pdf_file: Archivo del PDF posicionado al inicio (el llamador lo cierra)
+        """
+        await asyncio.to_thread(self._store_pdf, delivery_id, pdf_file)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _mark_failed(self, delivery_id: str, error: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE deliveries SET status = ?, last_error = ?, updated_at = ?, owner = NULL, "
+                "lease_until = NULL WHERE id = ?",
+                (STATUS_FAILED, error[:1000], time.time(), delivery_id)
+            )
+        finally:
+            conn.close()
+
+    async def fail(self, delivery_id: str, error: str) -> None:
+        """Marca como fallido un envío cuyo render no se pudo completar"""
+        await asyncio.to_thread(self._mark_failed, delivery_id, error)
+        metrics.inc("delivery.failed")
+
+    def _get(self, delivery_id: str) -> Optional[dict]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT id, status, recipients, filename, attempts, created_at, sent_at, "
+                "next_attempt_at, last_error FROM deliveries WHERE id = ?",
+                (delivery_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        info = dict(row)
+        info['recipients'] = json.loads(info['recipients'])
+        return info
+
+    async def get(self, delivery_id: str) -> Optional[dict]:
+        """Estado de un envío (None si no existe o ya se depuró)"""
+        return await asyncio.to_thread(self._get, delivery_id)
+
+    def _count_by_status(self) -> dict:
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM deliveries GROUP BY status").fetchall())
+        finally:
+            conn.close()
+
+    async def stats(self) -> dict:
+        """Cantidad de envíos por estado"""
+        return await asyncio.to_thread(self._count_by_status)
+
+    # ---- Workers ----
+
+    @staticmethod
+    def _recover_expired(conn: sqlite3.Connection, now: float) -> None:
+        """Retoma envíos interrumpidos y descarta renders cuyo proceso dueño ya no respondió"""
+        expired = "status = ? AND (lease_until IS NULL OR lease_until < ?)"
+        recovered = conn.execute(
+            "UPDATE deliveries SET status = ?, next_attempt_at = ?, updated_at = ?, owner = NULL, "
+            f"lease_until = NULL WHERE {expired}",
+            (STATUS_PENDING, now, now, STATUS_SENDING, now)
+        ).rowcount
+        abandoned = conn.execute(
+            "UPDATE deliveries SET status = ?, last_error = ?, updated_at = ?, owner = NULL, "
+            f"lease_until = NULL WHERE {expired}",
+            (STATUS_FAILED, "Render interrumpido (el proceso terminó antes de generar el PDF)", now,
+             STATUS_RENDERING, now)
+        ).rowcount
+        if recovered or abandoned:
+            metrics.inc("delivery.recovered", recovered)
+            metrics.inc("delivery.failed", abandoned)
+            logger.warning(
+                "Envíos con lease vencido: %d reintentados, %d renders descartados", recovered, abandoned
+            )
+
+    def _claim_batch(self) -> List[sqlite3.Row]:
+        """
+        Toma hasta DELIVERY_BATCH_SIZE envíos vencidos (atómico entre workers y procesos)
+
+        En la misma transacción retoma los envíos cuyo lease venció.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._recover_expired(conn, now)
+            rows = conn.execute(
+                "SELECT * FROM deliveries WHERE status = ? AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (STATUS_PENDING, now, settings.DELIVERY_BATCH_SIZE)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE deliveries SET status = ?, updated_at = ?, owner = ?, lease_until = ? WHERE id = ?",
+                [(STATUS_SENDING, now, self.owner, now + settings.DELIVERY_LEASE_SECONDS, row['id'])
+                 for row in rows]
+            )
+            conn.execute("COMMIT")
+            if now - self._last_prune > PRUNE_INTERVAL_SECONDS:
+                self._prune(conn)
+                self._last_prune = now
+            return rows
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _prune(conn: sqlite3.Connection) -> None:
+        cutoff = time.time() - settings.DELIVERY_RETENTION_DAYS * 86400
+        conn.execute(
+            "DELETE FROM deliveries WHERE status IN (?, ?) AND updated_at < ?",
+            (STATUS_SENT, STATUS_FAILED, cutoff)
+        )
+
+    @staticmethod
+    def _build_message(row: sqlite3.Row) -> EmailMessage:
+        message = EmailMessage()
+        message['From'] = settings.EMAIL_FROM
+        message['To'] = ", ".join(json.loads(row['recipients']))
+        message['Subject'] = row['subject']
+        message.set_content(row['body'])
+        message.add_attachment(
+            Path(row['pdf_path']).read_bytes(),
+            maintype='application',
+            subtype='pdf',
+            filename=row['filename']
+        )
+        return message
+
+    def _complete(self, outcomes: list) -> None:
+        """Registra el resultado del lote y borra los PDFs que ya no se necesitan"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("BEGIN")
+                for row, error, permanent in outcomes:
+                    attempts = row['attempts'] + 1
+                    if error is None:
+                        conn.execute(
+                            "UPDATE deliveries SET status = ?, attempts = ?, sent_at = ?, "
+                            "updated_at = ?, last_error = NULL, owner = NULL, lease_until = NULL WHERE id = ?",
+                            (STATUS_SENT, attempts, now, now, row['id'])
+                        )
+                    elif permanent or attempts >= settings.DELIVERY_MAX_ATTEMPTS:
+                        conn.execute(
+                            "UPDATE deliveries SET status = ?, attempts = ?, updated_at = ?, "
+                            "last_error = ?, owner = NULL, lease_until = NULL WHERE id = ?",
+                            (STATUS_FAILED, attempts, now, error[:1000], row['id'])
+                        )
+                    else:
+                        conn.execute(
+                            "UPDATE deliveries SET status = ?, attempts = ?, next_attempt_at = ?, "
+                            "updated_at = ?, last_error = ?, owner = NULL, lease_until = NULL WHERE id = ?",
+                            (STATUS_PENDING, attempts, now + self._backoff(attempts), now,
+                             error[:1000], row['id'])
+                        )
+        finally:
+            conn.close()
+        for row, error, permanent in outcomes:
+            if error is None or permanent or row['attempts'] + 1 >= settings.DELIVERY_MAX_ATTEMPTS:
+                Path(row['pdf_path']).unlink(missing_ok=True)
+
+    @staticmethod
+    def _backoff(attempts: int) -> float:
+        """Espera exponencial con jitter antes del siguiente intento"""
+        delay = min(
+            settings.DELIVERY_BACKOFF_SECONDS * 2 ** (attempts - 1),
+            settings.DELIVERY_BACKOFF_MAX_SECONDS
+        )
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _send_batch(self, session: _SMTPSession, rows: List[sqlite3.Row]) -> None:
+        outcomes = []
+        for row in rows:
+            # Armar el mensaje no toca la conexión: sus errores no cierran la sesión
+            try:
+                message = await asyncio.to_thread(self._build_message, row)
+            except FileNotFoundError as e:
+                # Sin el PDF no hay nada que reintentar
+                outcomes.append((row, f"PDF no encontrado: {e.filename}", True))
+                continue
+            except OSError as e:
+                outcomes.append((row, f"Lectura del PDF: {e}", False))
+                continue
+            except Exception as e:
+                # Mensaje inválido (ej. encabezados): reintentar no cambiaría el resultado
+                outcomes.append((row, f"Mensaje inválido: {type(e).__name__}: {e}", True))
+                continue
+
+            try:
+                refused = await session.send(message)
+                if refused:
+                    logger.warning("Envío %s: destinatarios rechazados %s", row['id'], list(refused))
+                outcomes.append((row, None, False))
+                metrics.inc("delivery.sent")
+            except OSError as e:
+                outcomes.append((row, f"Conexión SMTP: {e}", False))
+                await session.close()
+            except Exception as e:
+                outcomes.append((row, f"{type(e).__name__}: {e}", _is_permanent(e)))
+                if not _server_replied(e):
+                    # Sin respuesta del servidor la conexión quedó en mal estado: abrir otra
+                    await session.close()
+        for _, error, permanent in outcomes:
+            if error is not None:
+                metrics.inc("delivery.failed" if permanent else "delivery.retried")
+        metrics.observe("delivery.batch_size", len(rows))
+        await asyncio.to_thread(self._complete, outcomes)
+
+    async def _worker(self) -> None:
+        session = _SMTPSession()
+        try:
+            while not self._stopping:
+                try:
+                    rows = await asyncio.to_thread(self._claim_batch)
+                    if rows:
+                        await self._send_batch(session, rows)
+                        continue
+                except Exception:
+                    metrics.inc("delivery.worker_errors")
+                    logger.exception("Error en worker de envío de emails")
+
+                if session.last_used and time.monotonic() - session.last_used > settings.DELIVERY_IDLE_SECONDS:
+                    await session.close()
+                    session.last_used = 0.0
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.DELIVERY_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            await session.close()
+
+    async def run(self) -> None:
+        """Workers de envío (task en segundo plano durante la vida de la app)"""
+        self._wakeup = asyncio.Event()
+        await asyncio.gather(*(self._worker() for _ in range(settings.DELIVERY_WORKERS)))
+
+    async def stop(self) -> None:
+        """Detiene los workers al terminar su lote actual (lo pendiente sigue en la base)"""
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+
+delivery_queue = DeliveryQueue()
@@ -1,11 +1,89 @@
 """
 Servicio para procesamiento y optimización de imágenes
 """
-from PIL import Image, ImageOps
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+import numpy as np
 import io
 import base64
-from typing import List, Tuple
+from functools import lru_cache
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple, Union
 from config import settings
+from cancellation import CancelToken
+from render_profiles import RenderProfile, get_profile
+from memory_profiler import memory_profiler
+
+
+HASH_SIZE = 8  # dHash de 8x8 = 64 bits
+HASH_DECODE_SIZE = 64  # Decodificación reducida (JPEG draft) para calcular el hash
+
+# Proporciones de cada celda de la hoja de contactos (relativas al ancho de la celda),
+# equivalentes a las tarjetas .photo-card del template
+SHEET_GUTTER_RATIO = 0.04
+SHEET_PHOTO_ASPECT = 0.75  # Alto / ancho del área de la foto
+SHEET_LABEL_RATIO = 0.08
+SHEET_BORDER_COLOR = (221, 221, 221)  # #ddd
+SHEET_LABEL_COLOR = (85, 85, 85)  # #555
+
+# Imagen original: bytes o archivo abierto (ej. el SpooledTemporaryFile de un upload)
+ImageSource = Union[bytes, BinaryIO]
+
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+def read_image_source(source: ImageSource) -> bytes:
+    """Contenido completo de una imagen original (los archivos se leen desde el inicio)"""
+    if isinstance(source, bytes):
+        return source
+    source.seek(0)
+    return source.read()
+
+
+def iter_image_source_chunks(source: ImageSource) -> Iterator[bytes]:
+    """Contenido de una imagen original por bloques, sin cargar el archivo completo"""
+    if isinstance(source, bytes):
+        yield source
+        return
+    source.seek(0)
+    while chunk := source.read(READ_CHUNK_BYTES):
+        yield chunk
+    source.seek(0)
+
+
+def image_source_size(source: ImageSource) -> int:
+    """Tamaño en bytes de una imagen original"""
+    if isinstance(source, bytes):
+        return len(source)
+    source.seek(0, io.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+def close_image_source(source: Optional[ImageSource]) -> None:
+    """Cierra el archivo de una imagen original (los bytes no requieren nada)"""
+    if source is not None and not isinstance(source, bytes):
+        source.close()
+
+
+def release_image_sources(sources: List[Optional[ImageSource]]) -> None:
+    """Cierra los archivos pendientes de una lista de originales y la deja en None"""
+    for idx, source in enumerate(sources):
+        close_image_source(source)
+        sources[idx] = None
+
+
+@lru_cache(maxsize=8)
+def _label_font(size: int) -> ImageFont.ImageFont:
+    """Fuente de las etiquetas FOTO n (DejaVu si está instalada, si no la de Pillow)"""
+    try:
+        return ImageFont.truetype("DejaVuSans-Bold.ttf", size)
+    except OSError:
+        pass
+    try:
+        return ImageFont.load_default(size)
+    except (TypeError, ImportError):
+        # Pillow sin FreeType: fuente bitmap de tamaño fijo
+        return ImageFont.load_default()
 
 
 class ImageProcessor:
@@ -15,7 +93,10 @@ class ImageProcessor:
     def optimize_image(
         image_bytes: bytes,
         max_width: int = None,
-        quality: int = None
+        quality: int = None,
+        resample: Image.Resampling = Image.Resampling.LANCZOS,
+        optimize: bool = True,
+        progressive: bool = False
     ) -> Tuple[bytes, dict]:
         """
         Optimiza una imagen para inserción en PDF
@@ -24,58 +105,171 @@ class ImageProcessor:
             image_bytes: Bytes de la imagen original
             max_width: Ancho máximo en píxeles (default: config.MAX_IMAGE_WIDTH)
             quality: Calidad JPEG 0-100 (default: config.IMAGE_QUALITY)
+            resample: Filtro de redimensionado
+            optimize: Pasada extra de optimización del JPEG
+            progressive: Guardar como JPEG progresivo
         
         Returns:
             Tuple de (imagen_optimizada_bytes, metadata)
         """
-        if max_width is None:
-            max_width = settings.MAX_IMAGE_WIDTH
         if quality is None:
             quality = settings.IMAGE_QUALITY
         
-        img = Image.open(io.BytesIO(image_bytes))
+        img, metadata = ImageProcessor.prepare_image(image_bytes, max_width=max_width, resample=resample)
+        
+        with memory_profiler.stage('encode', metadata.get('memory_stages'), metric_prefix="image"):
+            output = io.BytesIO()
+            img.save(
+                output,
+                format='JPEG',
+                quality=quality,
+                optimize=optimize,
+                progressive=progressive
+            )
+            optimized_bytes = output.getvalue()
+        
+        original_size = metadata['original_size_bytes']
+        metadata.update({
+            'optimized_size_bytes': len(optimized_bytes),
+            'compression_ratio': round(original_size / len(optimized_bytes), 2),
+            'size_reduction_percent': round((1 - len(optimized_bytes) / original_size) * 100, 1)
+        })
+        
+        return optimized_bytes, metadata
+    
+    @staticmethod
+    def prepare_image(
+        image_bytes: bytes,
+        max_width: int = None,
+        max_height: int = None,
+        resample: Image.Resampling = Image.Resampling.LANCZOS
+    ) -> Tuple[Image.Image, dict]:
+        """
+        Decodifica, redimensiona y aplana una imagen, lista para codificar o componer
+        
+        Args:
+            image_bytes: Bytes de la imagen original
+            max_width: Ancho máximo en píxeles (default: config.MAX_IMAGE_WIDTH)
+            max_height: Alto máximo en píxeles (opcional, sin límite por defecto)
+            resample: Filtro de redimensionado
+        
+        Returns:
+            Tuple de (imagen RGB o L, metadata con tamaños y dimensiones originales)
+        """
+        if max_width is None:
+            max_width = settings.MAX_IMAGE_WIDTH
+        
+        memory = {} if memory_profiler.enabled else None
+        
+        with memory_profiler.stage('decode', memory, metric_prefix="image"):
+            img = Image.open(io.BytesIO(image_bytes))
 
-        # Aplicar orientación EXIF (fotos de celular aparecen giradas sin esto)
-        img = ImageOps.exif_transpose(img)
+            # Aplicar orientación EXIF (fotos de celular aparecen giradas sin esto)
+            img = ImageOps.exif_transpose(img)
+            # Image.open es perezoso: decodificar aquí para medir la etapa real
+            img.load()
 
-        original_size = len(image_bytes)
         original_width, original_height = img.size
 
-        # Convertir RGBA/LA/P a RGB (PDFs no manejan bien alpha channel)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            if img.mode == 'RGBA':
-                background.paste(img, mask=img.split()[-1])
-            else:
-                background.paste(img)
-            img = background
-        
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        new_width, new_height = original_width, original_height
-        if img.width > max_width:
+        with memory_profiler.stage('resize', memory, metric_prefix="image"):
+            # Redimensionar antes de aplanar el alpha: la composición sobre blanco
+            # se hace sobre los píxeles finales y no sobre la imagen original
+            img = ImageProcessor._prepare_for_resize(img)
             ratio = max_width / img.width
-            new_height = int(img.height * ratio)
-            new_width = max_width
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            if max_height is not None:
+                ratio = min(ratio, max_height / img.height)
+            if ratio < 1:
+                img = img.resize(
+                    (max(1, round(img.width * ratio)), max(1, int(img.height * ratio))),
+                    resample
+                )
         
-        output = io.BytesIO()
-        img.save(output, format='JPEG', quality=quality, optimize=True)
-        optimized_bytes = output.getvalue()
+        with memory_profiler.stage('convert', memory, metric_prefix="image"):
+            img = ImageProcessor._flatten_for_jpeg(img)
         
         metadata = {
-            'original_size_bytes': original_size,
-            'optimized_size_bytes': len(optimized_bytes),
+            'original_size_bytes': len(image_bytes),
             'original_dimensions': (original_width, original_height),
-            'final_dimensions': (new_width, new_height),
-            'compression_ratio': round(original_size / len(optimized_bytes), 2),
-            'size_reduction_percent': round((1 - len(optimized_bytes) / original_size) * 100, 1)
+            'final_dimensions': img.size
         }
+        if memory is not None:
+            metadata['memory_stages'] = memory
         
-        return optimized_bytes, metadata
+        return img, metadata
+    
+    @staticmethod
+    def _prepare_for_resize(img: Image.Image) -> Image.Image:
+        """
+        Lleva la imagen a un modo que se pueda redimensionar sin copias RGBA de tamaño completo
+        
+        - RGBA/LA con alpha totalmente opaco (capturas de pantalla): se descarta el alpha.
+        - RGBA/LA/PA: alpha premultiplicado (RGBa/La), el mismo paso que Pillow hace
+          internamente al redimensionar; el aplanado se hace después, ya reducida.
+        - P: la transparencia se compone sobre blanco en la paleta (≤256 colores)
+          y la imagen pasa a RGB sin canal alpha.
+        - RGB/L/CMYK: sin cambios (se convierten después de redimensionar).
+        """
+        if img.mode in ('RGBA', 'LA'):
+            if img.getchannel('A').getextrema()[0] == 255:
+                return img.convert(img.mode[:-1])
+            return img.convert(img.mode[:-1] + 'a')
+        if img.mode == 'PA':
+            return img.convert('RGBA').convert('RGBa')
+        if img.mode == 'P':
+            return ImageProcessor._flatten_palette(img).convert('RGB')
+        if img.mode in ('RGB', 'L', 'CMYK'):
+            return img
+        return img.convert('RGB')
+    
+    @staticmethod
+    def _flatten_palette(img: Image.Image) -> Image.Image:
+        """Compone sobre blanco las entradas transparentes de la paleta (no los píxeles)"""
+        palette_alpha = None
+        if img.palette is not None and img.palette.mode == 'RGBA':
+            entries = np.array(img.getpalette('RGBA'), dtype=np.uint16).reshape(-1, 4)
+            palette, palette_alpha = entries[:, :3], entries[:, 3]
+        else:
+            transparency = img.info.get('transparency')
+            if transparency is None:
+                return img
+            palette = np.array(img.getpalette('RGB'), dtype=np.uint16).reshape(-1, 3)
+            palette_alpha = np.full(len(palette), 255, dtype=np.uint16)
+            if isinstance(transparency, int):
+                if transparency < len(palette_alpha):
+                    palette_alpha[transparency] = 0
+            else:
+                count = min(len(transparency), len(palette_alpha))
+                palette_alpha[:count] = np.frombuffer(transparency, dtype=np.uint8)[:count]
+        
+        alpha = palette_alpha[:, None]
+        flattened = (palette * alpha + 255 * (255 - alpha) + 127) // 255
+        img = img.copy() if img.readonly else img
+        img.putpalette(flattened.astype(np.uint8).tobytes(), 'RGB')
+        img.info.pop('transparency', None)
+        return img
+    
+    @staticmethod
+    def _flatten_for_jpeg(img: Image.Image) -> Image.Image:
+        """
+        Deja la imagen en RGB o L para JPEG; con alpha premultiplicado aplana sobre blanco
+        
+        Con color premultiplicado la composición sobre blanco es una suma:
+        c * a/255 + 255 * (1 - a/255) = c_premultiplicado + (255 - a).
+        El rebote (ringing) de LANCZOS puede dejar c_premultiplicado > a en
+        los bordes con alpha parcial; se limita a a antes de sumar para que
+        la suma no desborde uint8 (un valor premultiplicado válido nunca
+        supera su alpha).
+        """
+        if img.mode in ('RGBa', 'La'):
+            pixels = np.asarray(img)
+            alpha = pixels[..., -1:]
+            flattened = np.minimum(pixels[..., :-1], alpha) + (255 - alpha)
+            if img.mode == 'La':
+                return Image.fromarray(flattened[..., 0], 'L')
+            return Image.fromarray(flattened, 'RGB')
+        if img.mode in ('RGB', 'L'):
+            return img
+        return img.convert('RGB')
     
     @staticmethod
     def image_to_base64(image_bytes: bytes) -> str:
@@ -91,42 +285,385 @@ class ImageProcessor:
         b64 = base64.b64encode(image_bytes).decode('utf-8')
         return f"data:image/jpeg;base64,{b64}"
     
+    @staticmethod
+    def perceptual_hash(image: ImageSource) -> np.ndarray:
+        """
+        Calcula el dHash (gradiente horizontal) de una imagen
+        
+        Decodifica a resolución reducida (JPEG draft) para que el costo sea
+        mínimo comparado con optimize_image. Un archivo se lee directamente
+        (sin copiarlo a memoria) y queda posicionado al inicio.
+        
+        Args:
+            image: Bytes de la imagen o archivo abierto
+        
+        Returns:
+            Array booleano de HASH_SIZE * HASH_SIZE bits
+        """
+        if isinstance(image, bytes):
+            image = io.BytesIO(image)
+        image.seek(0)
+        try:
+            img = Image.open(image)
+            img.draft('L', (HASH_DECODE_SIZE, HASH_DECODE_SIZE))
+            img = ImageOps.exif_transpose(img).convert('L')
+        finally:
+            image.seek(0)
+        img = img.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR)
+        pixels = np.asarray(img, dtype=np.int16)
+        return (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    
+    @staticmethod
+    def find_near_duplicates(
+        images_bytes: List[ImageSource],
+        threshold: float = None
+    ) -> List[Optional[int]]:
+        """
+        Detecta fotos casi idénticas (ráfagas) comparando perceptual hashes
+        
+        Las distancias de Hamming de todo el lote se calculan de una vez con
+        NumPy. Cada imagen se compara contra las anteriores que se conservan;
+        la primera de un grupo de duplicados es la que se conserva.
+        
+        Args:
+            images_bytes: Lista de imágenes (bytes o archivos abiertos)
+            threshold: Similitud mínima 0-1 para considerar duplicado
+                       (default: config.DEDUP_SIMILARITY_THRESHOLD)
+        
+        Returns:
+            Lista paralela: índice de la imagen de la que es duplicado, o None
+        """
+        if threshold is None:
+            threshold = settings.DEDUP_SIMILARITY_THRESHOLD
+        
+        duplicate_of: List[Optional[int]] = [None] * len(images_bytes)
+        hashes, hashed_indices = [], []
+        for idx, img_bytes in enumerate(images_bytes):
+            try:
+                hashes.append(ImageProcessor.perceptual_hash(img_bytes))
+                hashed_indices.append(idx)
+            except (OSError, ValueError):
+                # Imagen ilegible: no se descarta aquí, optimize_image reportará el error
+                continue
+        if len(hashes) < 2:
+            return duplicate_of
+        
+        bits = np.stack(hashes)
+        distances = np.count_nonzero(bits[:, None, :] != bits[None, :, :], axis=2)
+        similarity = 1.0 - distances / bits.shape[1]
+        
+        kept: List[int] = []
+        for row, idx in enumerate(hashed_indices):
+            if kept:
+                candidates = similarity[row, kept]
+                best = int(np.argmax(candidates))
+                if candidates[best] >= threshold:
+                    duplicate_of[idx] = hashed_indices[kept[best]]
+                    continue
+            kept.append(row)
+        
+        return duplicate_of
+    
+    @staticmethod
+    def iter_images_for_pdf(
+        images_bytes: List[Optional[ImageSource]],
+        cancel_token: Optional[CancelToken] = None,
+        profile: Optional[RenderProfile] = None,
+        release_originals: bool = False
+    ) -> Iterator[Tuple[bytes, dict]]:
+        """
+        Optimiza las imágenes una por una a medida que se consumen
+        
+        Los originales pueden ser bytes o archivos abiertos (uploads en disco):
+        cada archivo se lee recién al procesar su imagen, así que en memoria
+        vive un solo original a la vez. Con release_originals=True cada
+        posición de images_bytes se reemplaza por None (y su archivo se cierra)
+        en cuanto existe su versión optimizada, de modo que el original se
+        libera aunque el llamador conserve la lista.
+        
+        Args:
+            images_bytes: Lista de imágenes, bytes o archivos (se modifica si release_originals)
+            cancel_token: Token consultado antes de cada imagen (opcional)
+            profile: Perfil de render (default: config.RENDER_DEFAULT_PROFILE)
+            release_originals: Liberar cada original después de optimizarlo
+        
+        Yields:
+            Tuple de (jpeg_optimizado_bytes, metadata). Con DEDUP_MODE=drop las
+            fotos duplicadas no se emiten; con DEDUP_MODE=flag su metadata
+            incluye 'duplicate_of'. Cada metadata incluye 'source_index'.
+        
+        Raises:
+            RenderCancelled: Si el token se cancela durante el procesamiento
+        """
+        if profile is None:
+            profile = get_profile()
+        
+        return ImageProcessor._iter_sources(
+            images_bytes,
+            lambda image_bytes: ImageProcessor.optimize_image(
+                image_bytes,
+                resample=profile.resample,
+                optimize=profile.jpeg_optimize,
+                progressive=profile.jpeg_progressive
+            ),
+            cancel_token=cancel_token,
+            release_originals=release_originals
+        )
+    
+    @staticmethod
+    def iter_prepared_images(
+        images_bytes: List[Optional[ImageSource]],
+        max_width: int,
+        max_height: int,
+        cancel_token: Optional[CancelToken] = None,
+        profile: Optional[RenderProfile] = None,
+        release_originals: bool = False
+    ) -> Iterator[Tuple[Image.Image, dict]]:
+        """
+        Como iter_images_for_pdf, pero entrega las imágenes sin codificar
+        
+        Para componerlas (hojas de contactos) sin pasar por un JPEG intermedio:
+        cada imagen se redimensiona una sola vez, al tamaño de su destino.
+        
+        Args:
+            images_bytes: Lista de imágenes, bytes o archivos (se modifica si release_originals)
+            max_width: Ancho máximo en píxeles
+            max_height: Alto máximo en píxeles
+            cancel_token: Token consultado antes de cada imagen (opcional)
+            profile: Perfil de render (default: config.RENDER_DEFAULT_PROFILE)
+            release_originals: Liberar cada original después de procesarlo
+        
+        Yields:
+            Tuple de (imagen PIL, metadata), ver iter_images_for_pdf
+        
+        Raises:
+            RenderCancelled: Si el token se cancela durante el procesamiento
+        """
+        if profile is None:
+            profile = get_profile()
+        
+        return ImageProcessor._iter_sources(
+            images_bytes,
+            lambda image_bytes: ImageProcessor.prepare_image(
+                image_bytes,
+                max_width=max_width,
+                max_height=max_height,
+                resample=profile.resample
+            ),
+            cancel_token=cancel_token,
+            release_originals=release_originals
+        )
+    
+    @staticmethod
+    def _iter_sources(
+        images_bytes: List[Optional[ImageSource]],
+        process: Callable[[bytes], Tuple[Any, dict]],
+        cancel_token: Optional[CancelToken] = None,
+        release_originals: bool = False
+    ) -> Iterator[Tuple[Any, dict]]:
+        """Recorre los originales (dedup, cancelación, liberación) aplicando process a cada uno"""
+        duplicate_of: List[Optional[int]] = [None] * len(images_bytes)
+        if settings.DEDUP_MODE != "off":
+            duplicate_of = ImageProcessor.find_near_duplicates(images_bytes)
+        
+        for idx in range(len(images_bytes)):
+            if cancel_token is not None:
+                cancel_token.check("images")
+            
+            if duplicate_of[idx] is not None and settings.DEDUP_MODE == "drop":
+                if release_originals:
+                    close_image_source(images_bytes[idx])
+                    images_bytes[idx] = None
+                continue
+            
+            result, metadata = process(read_image_source(images_bytes[idx]))
+            if release_originals:
+                close_image_source(images_bytes[idx])
+                images_bytes[idx] = None
+            
+            metadata['source_index'] = idx
+            if duplicate_of[idx] is not None:
+                metadata['duplicate_of'] = duplicate_of[idx]
+            
+            yield result, metadata
+    
+    @staticmethod
+    def contact_sheet_photo_box(columns: int = None, width: int = None) -> Tuple[int, int]:
+        """
+        Tamaño máximo (ancho, alto) de una foto dentro de su celda de la hoja de contactos
+        
+        Args:
+            columns: Fotos por fila (default: config.CONTACT_SHEET_COLUMNS)
+            width: Ancho de la hoja en píxeles (default: config.CONTACT_SHEET_WIDTH)
+        """
+        columns = columns or settings.CONTACT_SHEET_COLUMNS
+        width = width or settings.CONTACT_SHEET_WIDTH
+        cell_width = width // columns
+        gutter = max(1, round(cell_width * SHEET_GUTTER_RATIO))
+        box_width = cell_width - 2 * gutter
+        return box_width, round(box_width * SHEET_PHOTO_ASPECT)
+    
+    @staticmethod
+    def iter_contact_sheets(
+        photos: Iterable[Image.Image],
+        columns: int = None,
+        rows: int = None,
+        width: int = None,
+        quality: int = None,
+        cancel_token: Optional[CancelToken] = None,
+        profile: Optional[RenderProfile] = None
+    ) -> Iterator[Tuple[bytes, dict]]:
+        """
+        Compone las fotos en hojas de contactos: una imagen por página del PDF
+        
+        Cada hoja es una cuadrícula de columns x rows celdas con la foto
+        centrada, el borde de la tarjeta y su etiqueta "FOTO n" ya dibujados,
+        de modo que WeasyPrint maqueta y embebe una sola imagen por página.
+        Todas las hojas tienen el mismo tamaño para conservar la escala en
+        el PDF; las celdas sobrantes de la última quedan en blanco.
+        
+        Las fotos se consumen a medida que se pegan: en memoria viven la hoja
+        en curso y una foto. Lo ideal es recibirlas ya redimensionadas a
+        contact_sheet_photo_box() (iter_prepared_images), sin JPEG intermedio:
+        la hoja es la única codificación.
+        
+        Args:
+            photos: Imágenes PIL en orden (iterable, se consume)
+            columns: Fotos por fila (default: config.CONTACT_SHEET_COLUMNS)
+            rows: Filas por hoja (default: config.CONTACT_SHEET_ROWS)
+            width: Ancho de la hoja en píxeles (default: config.CONTACT_SHEET_WIDTH)
+            quality: Calidad JPEG 0-100 (default: config.IMAGE_QUALITY)
+            cancel_token: Token consultado antes de cada hoja (opcional)
+            profile: Perfil de render (default: config.RENDER_DEFAULT_PROFILE)
+        
+        Yields:
+            Tuple de (jpeg_hoja_bytes, metadata con 'first_photo', 'photos' y 'size_bytes')
+        
+        Raises:
+            RenderCancelled: Si el token se cancela durante la composición
+        """
+        columns = columns or settings.CONTACT_SHEET_COLUMNS
+        rows = rows or settings.CONTACT_SHEET_ROWS
+        width = width or settings.CONTACT_SHEET_WIDTH
+        if quality is None:
+            quality = settings.IMAGE_QUALITY
+        if profile is None:
+            profile = get_profile()
+        
+        cell_width = width // columns
+        gutter = max(1, round(cell_width * SHEET_GUTTER_RATIO))
+        box_width, box_height = ImageProcessor.contact_sheet_photo_box(columns, width)
+        label_height = round(cell_width * SHEET_LABEL_RATIO)
+        cell_height = box_height + label_height + 2 * gutter
+        font = _label_font(round(label_height * 0.6))
+        per_sheet = columns * rows
+        
+        def encode_sheet(sheet: Image.Image, first: int, count: int) -> Tuple[bytes, dict]:
+            output = io.BytesIO()
+            sheet.save(
+                output,
+                format='JPEG',
+                quality=quality,
+                optimize=profile.jpeg_optimize,
+                progressive=profile.jpeg_progressive
+            )
+            return output.getvalue(), {
+                'first_photo': first + 1,
+                'photos': count,
+                'size_bytes': output.tell()
+            }
+        
+        sheet = draw = None
+        first = 0
+        for idx, img in enumerate(photos):
+            slot = idx - first
+            if sheet is None:
+                if cancel_token is not None:
+                    cancel_token.check("images")
+                sheet = Image.new('RGB', (cell_width * columns, cell_height * rows), (255, 255, 255))
+                draw = ImageDraw.Draw(sheet)
+            left = (slot % columns) * cell_width
+            top = (slot // columns) * cell_height
+            
+            if img.width > box_width or img.height > box_height:
+                img.thumbnail((box_width, box_height), profile.resample)
+            sheet.paste(img, (
+                left + gutter + (box_width - img.width) // 2,
+                top + gutter + (box_height - img.height) // 2
+            ))
+            del img
+            
+            draw.rectangle(
+                (left + gutter // 2, top + gutter // 2,
+                 left + cell_width - gutter // 2 - 1, top + cell_height - gutter // 2 - 1),
+                outline=SHEET_BORDER_COLOR,
+                width=max(1, gutter // 10)
+            )
+            # Centrado manual: la fuente bitmap de respaldo no soporta anchor
+            label = f"FOTO {idx + 1}"
+            text_left, text_top, text_right, text_bottom = draw.textbbox((0, 0), label, font=font)
+            draw.text(
+                (left + (cell_width - (text_right - text_left)) // 2 - text_left,
+                 top + gutter + box_height + (label_height - (text_bottom - text_top)) // 2 - text_top),
+                label,
+                fill=SHEET_LABEL_COLOR,
+                font=font
+            )
+            
+            if slot + 1 == per_sheet:
+                sheet_bytes, sheet_metadata = encode_sheet(sheet, first, per_sheet)
+                sheet = draw = None
+                first = idx + 1
+                yield sheet_bytes, sheet_metadata
+        
+        if sheet is not None:
+            sheet_bytes, sheet_metadata = encode_sheet(sheet, first, slot + 1)
+            sheet = draw = None
+            yield sheet_bytes, sheet_metadata
+    
     @staticmethod
     def process_images_for_pdf(
-        images_bytes: List[bytes]
+        images_bytes: List[bytes],
+        cancel_token: Optional[CancelToken] = None,
+        profile: Optional[RenderProfile] = None
     ) -> Tuple[List[str], List[dict]]:
         """
-        Procesa múltiples imágenes para PDF
+        Procesa múltiples imágenes para PDF como data URIs base64
         
         Args:
             images_bytes: Lista de bytes de imágenes
+            cancel_token: Token consultado antes de cada imagen (opcional)
+            profile: Perfil de render (default: config.RENDER_DEFAULT_PROFILE)
         
         Returns:
-            Tuple de (lista_base64_strings, lista_metadata)
+            Tuple de (lista_base64_strings, lista_metadata), ver iter_images_for_pdf
+        
+        Raises:
+            RenderCancelled: Si el token se cancela durante el procesamiento
         """
         processed_images = []
         metadata_list = []
         
-        for img_bytes in images_bytes:
-            optimized_bytes, metadata = ImageProcessor.optimize_image(img_bytes)
-            
-            base64_str = ImageProcessor.image_to_base64(optimized_bytes)
-            
-            processed_images.append(base64_str)
+        for optimized_bytes, metadata in ImageProcessor.iter_images_for_pdf(
+            images_bytes,
+            cancel_token=cancel_token,
+            profile=profile
+        ):
+            processed_images.append(ImageProcessor.image_to_base64(optimized_bytes))
             metadata_list.append(metadata)
         
         return processed_images, metadata_list
     
     @staticmethod
-    def validate_image_size(image_bytes: bytes) -> bool:
+    def validate_image_size(image_bytes: ImageSource) -> bool:
         """
         Valida que la imagen no exceda el tamaño máximo permitido
         
         Args:
-            image_bytes: Bytes de la imagen
+            image_bytes: Bytes de la imagen o archivo abierto (no se lee)
         
         Returns:
             True si es válida, False si excede el límite
         """
-        size_mb = len(image_bytes) / (1024 * 1024)
+        size_mb = image_source_size(image_bytes) / (1024 * 1024)
         return size_mb <= settings.MAX_IMAGE_SIZE_MB
@@ -7,7 +7,12 @@ from pathlib import Path
 class PDFGeneratorClient:
     """Cliente para comunicarse con el servicio de generación de PDFs"""
     
-    def __init__(self, base_url: str = "http://pdf-service:8000"):
+    def __init__(
+        self,
+        base_url: str = "http://pdf-service:8000",
+        priority_class: Optional[str] = None,
+        api_key: Optional[str] = None
+    ):
         """
         Inicializa el cliente
         
@@ -16,15 +21,25 @@ class PDFGeneratorClient:
                      - Local: http://localhost:8000
                      - Railway interno: http://pdf-service:8000
                      - Railway externo: https://tu-servicio.up.railway.app
+            priority_class: Clase de prioridad de los renders ("bulk" para lotes nocturnos)
+            api_key: Identificador del cliente para el reparto justo de la cola
         """
         self.base_url = base_url.rstrip('/')
         self.timeout = 60.0
+        # El servicio abandona el render si este cliente ya dejó de esperar
+        self.headers = {'X-Request-Timeout': str(self.timeout)}
+        if priority_class:
+            self.headers['X-Priority-Class'] = priority_class
+        if api_key:
+            self.headers['X-API-Key'] = api_key
     
     async def generate_site_visit_report(
         self,
         data: dict,
         image_paths: Optional[List[Path]] = None,
-        image_bytes: Optional[List[bytes]] = None
+        image_bytes: Optional[List[bytes]] = None,
+        profile: Optional[str] = None,
+        photo_layout: Optional[str] = None
     ) -> bytes:
         """
         Genera PDF de reporte de visita a obra
@@ -33,6 +48,8 @@ class PDFGeneratorClient:
             data: Diccionario con datos del formulario
             image_paths: Lista de rutas a archivos de imagen (opcional)
             image_bytes: Lista de bytes de imágenes (opcional)
+            profile: Perfil de render ("final" o "draft", default del servicio)
+            photo_layout: "grid" o "contact_sheet" (default del servicio)
         
         Returns:
             bytes del PDF generado
@@ -68,34 +85,102 @@ class PDFGeneratorClient:
             ```
         """
         async with httpx.AsyncClient(timeout=self.timeout) as client:
-            files = []
+            files = self._image_files(image_paths, image_bytes)
             
-            if image_paths:
-                for path in image_paths:
-                    with open(path, 'rb') as f:
-                        files.append(
-                            ('images', (path.name, f.read(), 'image/jpeg'))
-                        )
+            form = {'data': json.dumps(data)}
+            if profile:
+                form['profile'] = profile
+            if photo_layout:
+                form['photo_layout'] = photo_layout
             
-            elif image_bytes:
-                for idx, img_bytes in enumerate(image_bytes):
-                    files.append(
-                        ('images', (f'image_{idx}.jpg', img_bytes, 'image/jpeg'))
-                    )
+            response = await client.post(
+                f"{self.base_url}/api/reports/site-visit",
+                data=form,
+                files=files,
+                headers=self.headers
+            )
             
-            else:
-                raise ValueError("Debe proporcionar image_paths o image_bytes")
+            response.raise_for_status()
             
+            return response.content
+    
+    async def email_site_visit_report(
+        self,
+        data: dict,
+        recipients: List[str],
+        image_paths: Optional[List[Path]] = None,
+        image_bytes: Optional[List[bytes]] = None,
+        profile: Optional[str] = None
+    ) -> dict:
+        """
+        Pide al servicio generar el PDF y enviarlo por email (sin descargarlo)
+        
+        El servicio responde de inmediato; el render y el envío ocurren en
+        segundo plano. Requiere DELIVERY_ENABLED=true en el servicio.
+        
+        Args:
+            data: Diccionario con datos del formulario
+            recipients: Direcciones de destino
+            image_paths: Lista de rutas a archivos de imagen (opcional)
+            image_bytes: Lista de bytes de imágenes (opcional)
+            profile: Perfil de render ("final" o "draft", default del servicio)
+        
+        Returns:
+            Diccionario con 'delivery_id' y 'status_url' para consultar el estado
+        """
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            form = {'data': json.dumps(data), 'email_to': ', '.join(recipients)}
+            if profile:
+                form['profile'] = profile
             
             response = await client.post(
                 f"{self.base_url}/api/reports/site-visit",
-                data={'data': json.dumps(data)},
-                files=files
+                data=form,
+                files=self._image_files(image_paths, image_bytes),
+                headers=self.headers
             )
             
             response.raise_for_status()
             
-            return response.content
+            return response.json()
+    
+    async def get_delivery_status(self, delivery_id: str) -> dict:
+        """
+        Consulta el estado de un envío por email
+        
+        Returns:
+            Diccionario con 'status' (rendering, pending, sending, sent, failed) y detalles
+        """
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.get(f"{self.base_url}/api/deliveries/{delivery_id}")
+            response.raise_for_status()
+            return response.json()
+    
+    @staticmethod
+    def _image_files(
+        image_paths: Optional[List[Path]],
+        image_bytes: Optional[List[bytes]]
+    ) -> list:
+        """Arma la lista de archivos multipart a partir de rutas o bytes"""
+        files = []
+        
+        if image_paths:
+            for path in image_paths:
+                with open(path, 'rb') as f:
+                    files.append(
+                        ('images', (path.name, f.read(), 'image/jpeg'))
+                    )
+        
+        elif image_bytes:
+            for idx, img_bytes in enumerate(image_bytes):
+                files.append(
+                    ('images', (f'image_{idx}.jpg', img_bytes, 'image/jpeg'))
+                )
+        
+        else:
+            raise ValueError("Debe proporcionar image_paths o image_bytes")
+        
+        return files
     
     async def preview_site_visit_report(
         self,
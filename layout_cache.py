@@ -0,0 +1,96 @@
+"""
+Caché de corta duración para documentos ya maquetados por WeasyPrint
+
+El resumen (encabezado y tablas) depende solo de los datos del formulario:
+la vista previa lo maqueta y el render completo que llega después con los
+mismos datos reutiliza sus páginas en vez de volver a hacer el layout.
+Los documentos se retiran de la caché mientras se usan (pop), así que cada
+uno lo usa un solo hilo a la vez. Un render completo reclama su clave mientras
+corre: una vista previa en paralelo que termine después no guarda un resumen
+que ya nadie va a usar.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from config import settings
+
+
+class LayoutCache:
+    """LRU thread-safe con expiración por tiempo"""
+
+    def __init__(self, ttl_seconds: float = None, max_entries: int = None):
+        """
+        Inicializa la caché
+
+        Args:
+            ttl_seconds: Vida de cada entrada (default: config.LAYOUT_CACHE_SECONDS)
+            max_entries: Entradas máximas (default: config.LAYOUT_CACHE_MAX_ENTRIES)
+        """
+        self.ttl_seconds = ttl_seconds or settings.LAYOUT_CACHE_SECONDS
+        self.max_entries = max_entries or settings.LAYOUT_CACHE_MAX_ENTRIES
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        # Claves reclamadas por renders en curso (contador: puede haber más de uno)
+        self._claims: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(payload: str) -> str:
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Retorna la entrada vigente o None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def pop(self, key: str, claim: bool = False) -> Optional[Any]:
+        """
+        Retira y retorna la entrada vigente (uso exclusivo del llamador) o None
+        
+        Args:
+            key: Clave de la entrada
+            claim: Reclamar la clave hasta release(): put() no la vuelve a guardar
+        """
+        with self._lock:
+            if claim:
+                self._claims[key] = self._claims.get(key, 0) + 1
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            return value if expires_at >= time.monotonic() else None
+
+    def release(self, key: str) -> None:
+        """Libera una clave reclamada con pop(claim=True)"""
+        with self._lock:
+            remaining = self._claims.get(key, 0) - 1
+            if remaining > 0:
+                self._claims[key] = remaining
+            else:
+                self._claims.pop(key, None)
+
+    def put(self, key: str, value: Any) -> bool:
+        """
+        Guarda una entrada descartando la menos usada si se excede el máximo
+        
+        Returns:
+            False si la clave está reclamada por un render en curso (no se guarda)
+        """
+        with self._lock:
+            if key in self._claims:
+                return False
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
@@ -4,10 +4,18 @@ FastAPI Application - PDF Generator Service
 Endpoints para generación de PDFs de reportes
 """
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, status
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import io
 import json
+import math
+import re
+import threading
+import time
 import logging
 from pathlib import Path
 
@@ -18,21 +26,66 @@ from fastapi import Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
-from pdf_service import PDFGenerator
-from image_processor import ImageProcessor
+from pdf_service import PDFGenerator, PHOTO_LAYOUTS, get_photo_layout
+from image_processor import ImageProcessor, ImageSource, image_source_size, release_image_sources
+from render_scheduler import RenderScheduler, SchedulerOverloaded
+from metrics import metrics
+from render_profiles import RENDER_PROFILES, get_profile
+from memory_profiler import memory_profiler
+from render_history import render_history
+from cancellation import CancelToken, RenderCancelled
+from render_coalescer import Flight, RenderCoalescer, SharedFile
+from static_assets import StaticAssetRegistry
+from delivery_queue import delivery_queue
 
 templates = Jinja2Templates(directory="templates")
 logger = logging.getLogger(__name__)
 
 ALLOWED_IMAGE_CONTENT_TYPES = {"image/jpeg", "image/png", "image/webp"}
 ALLOWED_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+DISCONNECT_POLL_SECONDS = 0.5
+HTTP_499_CLIENT_CLOSED_REQUEST = 499
+PDF_STREAM_CHUNK_BYTES = 64 * 1024
+DELIVERY_RENDER_RETRY_SECONDS = 2.0  # Espera ante cola de renders llena; luego se duplica
+DELIVERY_RENDER_RETRY_MAX_SECONDS = 30.0
+EMAIL_PATTERN = re.compile(r"^[^@\s,;<>]+@[^@\s,;<>]+\.[^@\s,;<>]+$")
+
+pdf_generator = PDFGenerator()
+image_processor = ImageProcessor()
+render_scheduler = RenderScheduler()
+# Peticiones idénticas en curso (doble clic, reintentos) comparten un solo render
+render_coalescer = RenderCoalescer("render")
+preview_coalescer = RenderCoalescer("preview")
+# Formulario renderizado y comprimido una sola vez; CSS/JS con huella de contenido en la URL
+static_assets = StaticAssetRegistry(Path("static"))
+form_page = static_assets.render_page(
+    templates.get_template("site_visit_form.html").render,
+    cache_control=f"public, max-age={settings.FORM_CACHE_SECONDS}"
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    history_task = asyncio.create_task(render_history.run())
+    delivery_task = asyncio.create_task(delivery_queue.run()) if delivery_queue.enabled else None
+    yield
+    await render_history.stop()
+    history_task.cancel()
+    if delivery_task is not None:
+        # Dejar terminar el lote en curso; lo no enviado sigue en la cola durable
+        await delivery_queue.stop()
+        await asyncio.wait({delivery_task}, timeout=settings.SMTP_TIMEOUT_SECONDS)
+        delivery_task.cancel()
+    render_scheduler.shutdown()
+
 
 app = FastAPI(
     title=settings.APP_NAME,
     description="Servicio de generación de PDFs profesionales",
-    version="1.0.0",
+    version=settings.APP_VERSION,
     docs_url="/docs" if settings.DEBUG else None,  # Swagger UI
-    redoc_url="/redoc" if settings.DEBUG else None  # ReDoc
+    redoc_url="/redoc" if settings.DEBUG else None,  # ReDoc
+    lifespan=lifespan
 )
 
 if settings.CORS_ALLOW_CREDENTIALS and "*" in settings.CORS_ORIGINS:
@@ -49,8 +102,204 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-pdf_generator = PDFGenerator()
-image_processor = ImageProcessor()
+
+def _request_timeout(request: Request) -> float:
+    """Plazo de la petición: header del cliente o default, acotado al máximo configurado"""
+    timeout = settings.RENDER_DEADLINE_SECONDS
+    raw = request.headers.get(settings.RENDER_DEADLINE_HEADER)
+    if raw:
+        try:
+            timeout = float(raw)
+        except ValueError:
+            pass
+    # nan/inf pasan float() y la comparación con 0: usar el default
+    if not math.isfinite(timeout) or timeout <= 0:
+        timeout = settings.RENDER_DEADLINE_SECONDS
+    return min(timeout, settings.RENDER_DEADLINE_MAX_SECONDS)
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def _await_render(request: Request, cancel_token: CancelToken, flight: Flight):
+    """
+    Espera un render (posiblemente compartido) vigilando la desconexión del cliente y el plazo
+    
+    Si el cliente se va o vence el plazo, la petición se retira del flight; si
+    era la última en espera el render se cancela (el hilo abandona en la
+    siguiente etapa y el trabajo sale de la cola si no empezó).
+    
+    Raises:
+        RenderCancelled: Por desconexión o plazo vencido
+    """
+    disconnect_task = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait(
+            {flight.task, disconnect_task},
+            timeout=cancel_token.remaining(),
+            return_when=asyncio.FIRST_COMPLETED
+        )
+        if flight.task in done:
+            return flight.task.result()
+        cancel_token.cancel("disconnect" if disconnect_task in done else "deadline")
+        raise RenderCancelled(cancel_token.reason, "wait")
+    finally:
+        disconnect_task.cancel()
+        if not flight.task.done():
+            cancel_token.cancel("disconnect")
+            flight.leave(cancel_token.reason)
+
+
+def _parse_recipients(raw: Optional[str]) -> List[str]:
+    """Destinatarios de email_to (separados por coma, punto y coma o espacios)"""
+    if not raw or not raw.strip():
+        return []
+    if not delivery_queue.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El envío por email no está habilitado en este servicio"
+        )
+    recipients = [r for r in re.split(r"[,;\s]+", raw.strip()) if r]
+    invalid = [r for r in recipients if not EMAIL_PATTERN.match(r)]
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Direcciones de email inválidas: {', '.join(invalid)}"
+        )
+    if len(recipients) > settings.DELIVERY_MAX_RECIPIENTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Máximo {settings.DELIVERY_MAX_RECIPIENTS} destinatarios por reporte"
+        )
+    return recipients
+
+
+def _take_upload_file(upload: UploadFile) -> ImageSource:
+    """
+    Toma el archivo temporal de un upload sin leerlo a memoria
+    
+    FastAPI cierra los archivos del formulario al terminar el endpoint, pero
+    el render puede seguir después (envíos por email, peticiones coalescidas
+    que siguen esperando): desde aquí el archivo lo cierra el render.
+    """
+    file = upload.file
+    upload.file = io.BytesIO()
+    return file
+
+
+class _ImageHandoff:
+    """
+    Entrega las imágenes tomadas de los uploads al hilo del render
+    
+    Una vez que el render empieza, generate_site_visit_pdf cierra las imágenes.
+    Si el render nunca empieza (cola llena, trabajo retirado de la cola por
+    plazo, desconexión o cancelación) las cierra release_unstarted(). El lock
+    evita cerrarlas bajo un render que ya las está leyendo.
+    """
+    
+    def __init__(self, image_sources: List[ImageSource]):
+        self.image_sources = image_sources
+        self._lock = threading.Lock()
+        self._state = None  # None | 'running' | 'released'
+    
+    def render(self, *args, **kwargs):
+        """Ejecuta generate_site_visit_pdf en el hilo del render"""
+        with self._lock:
+            if self._state == 'released':
+                raise RenderCancelled("discarded", "queue")
+            self._state = 'running'
+        return pdf_generator.generate_site_visit_pdf(*args, **kwargs)
+    
+    def release_unstarted(self) -> None:
+        """Cierra las imágenes si el render todavía no empezó"""
+        with self._lock:
+            if self._state is not None:
+                return
+            self._state = 'released'
+        release_image_sources(self.image_sources)
+
+
+async def _render_for_delivery(
+    delivery_id: str,
+    data: SiteVisitData,
+    image_sources: List[ImageSource],
+    priority_class: str,
+    client_id: str,
+    **render_options
+) -> None:
+    """
+    Genera el PDF en segundo plano y lo deja en la cola de envío
+    
+    No depende de la conexión del cliente: solo lo limita RENDER_DEADLINE_MAX_SECONDS.
+    Si la cola de renders se llena después de responder 202 el render se
+    reintenta con backoff dentro de ese mismo plazo.
+    """
+    render_started = time.perf_counter()
+    cancel_token = CancelToken(settings.RENDER_DEADLINE_MAX_SECONDS)
+    retry_delay = DELIVERY_RENDER_RETRY_SECONDS
+    handoff = _ImageHandoff(image_sources)
+    try:
+        while True:
+            try:
+                pdf_file, metadata = await render_scheduler.submit(
+                    handoff.render,
+                    data,
+                    image_sources,
+                    cancel_token=cancel_token,
+                    priority_class=priority_class,
+                    client_id=client_id,
+                    **render_options
+                )
+                break
+            except SchedulerOverloaded:
+                if cancel_token.remaining() < retry_delay:
+                    raise
+                metrics.inc("delivery.render_retries")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, DELIVERY_RENDER_RETRY_MAX_SECONDS)
+    except Exception as e:
+        handoff.release_unstarted()
+        logger.exception("Error generando PDF para envío %s", delivery_id)
+        await delivery_queue.fail(delivery_id, f"Error generando PDF: {e}")
+        return
+    except BaseException:
+        # Cancelado (apagado del servicio) antes de que el render terminara
+        handoff.release_unstarted()
+        raise
+    
+    render_history.record(
+        metadata,
+        priority_class=priority_class,
+        total_ms=(time.perf_counter() - render_started) * 1000
+    )
+    try:
+        await delivery_queue.attach(delivery_id, pdf_file)
+    except Exception as e:
+        logger.exception("Error encolando envío %s", delivery_id)
+        await delivery_queue.fail(delivery_id, f"Error guardando PDF: {e}")
+    finally:
+        pdf_file.close()
+
+
+# Renders en segundo plano para envíos por email (referencia fuerte hasta que terminen)
+_delivery_renders: set = set()
+# Cupos de renders aceptados (202) sin terminar, cada uno con sus imágenes pendientes
+_delivery_render_slots = asyncio.Semaphore(settings.DELIVERY_MAX_PENDING_RENDERS)
+
+
+def _server_timing(stage_timings: dict, total_ms: float) -> str:
+    """
+    Header Server-Timing con las etapas del render
+    
+    'queue' es el tiempo total menos la suma de etapas (espera en cola aprox.)
+    """
+    queue_ms = max(0.0, total_ms - sum(stage_timings.values()))
+    entries = [f"queue;dur={queue_ms:.1f}"]
+    entries += [f"{stage};dur={ms:.1f}" for stage, ms in stage_timings.items()]
+    entries.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(entries)
 
 
 @app.get("/")
@@ -59,7 +308,7 @@ async def root():
     return {
         "service": settings.APP_NAME,
         "status": "operational",
-        "version": "1.0.0",
+        "version": settings.APP_VERSION,
         "environment": settings.ENVIRONMENT
     }
 
@@ -68,8 +317,22 @@ async def root():
 async def serve_form(request: Request):
     """
     Sirve el formulario HTML para generar reportes
+    
+    Pre-renderizado al iniciar; responde gzip/brotli según Accept-Encoding
+    y 304 si el navegador ya tiene la versión vigente (ETag).
+    """
+    return form_page.respond(request)
+
+
+@app.get("/static/{filename}", include_in_schema=False)
+async def serve_static(filename: str, request: Request):
+    """
+    Sirve CSS/JS del formulario por su URL con huella (cacheables como inmutables)
     """
-    return templates.TemplateResponse("site_visit_form.html", {"request": request})
+    asset = static_assets.get(filename)
+    if asset is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recurso no encontrado")
+    return asset.respond(request)
 
 
 @app.get("/health")
@@ -98,12 +361,18 @@ async def health_check():
         },
         400: {"description": "Error en validación de datos"},
         413: {"description": "Imagen demasiado grande"},
-        500: {"description": "Error interno del servidor"}
+        429: {"description": "Cola de renders llena, reintentar más tarde"},
+        500: {"description": "Error interno del servidor"},
+        504: {"description": "Plazo de la petición vencido"}
     }
 )
 async def generate_site_visit_pdf(
+    request: Request,
     data: str = Form(..., description="JSON con datos del formulario"),
-    images: List[UploadFile] = File(..., description="Imágenes de evidencia (JPG, PNG)")
+    images: List[UploadFile] = File(..., description="Imágenes de evidencia (JPG, PNG)"),
+    profile: Optional[str] = Form(None, description="Perfil de render: final (default) o draft"),
+    photo_layout: Optional[str] = Form(None, description="Distribución de fotos: grid o contact_sheet"),
+    email_to: Optional[str] = Form(None, description="Enviar el PDF por email a estas direcciones (responde 202)")
 ):
     """
     Genera PDF de reporte de visita a obra
@@ -111,6 +380,17 @@ async def generate_site_visit_pdf(
     **Parámetros:**
     - **data**: JSON string con los datos del formulario (ver schema SiteVisitData)
     - **images**: Lista de archivos de imagen (hasta 20 imágenes recomendado)
+    - **profile**: `final` (compresión máxima, default) o `draft` (rápido para revisión)
+    - **photo_layout**: `grid` (una imagen por foto) o `contact_sheet` (una imagen compuesta
+      por página: PDF más liviano y layout casi constante para reportes con muchas fotos)
+    - **email_to**: Direcciones separadas por coma. Si se indica, la API responde `202` de
+      inmediato con el `delivery_id` y el PDF se genera y envía en segundo plano
+      (estado en `GET /api/deliveries/{delivery_id}`). Requiere `DELIVERY_ENABLED=true`.
+    
+    **Headers opcionales:**
+    - **X-Priority-Class**: `interactive` (default) o `bulk` para lotes de integración
+    - **X-API-Key**: Identifica al cliente para el reparto justo de la cola
+    - **X-Request-Timeout**: Plazo en segundos; vencido se abandona el render (504)
     
     **Retorna:**
     - PDF file (application/pdf) para descarga directa
@@ -145,8 +425,23 @@ async def generate_site_visit_pdf(
                 detail="Debe proporcionar al menos una imagen"
             )
         
-        images_bytes = []
+        try:
+            render_profile = get_profile(profile)
+            photo_layout = get_photo_layout(photo_layout)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        recipients = _parse_recipients(email_to)
+        
+        cancel_token = CancelToken(_request_timeout(request))
+        
         for idx, image_file in enumerate(images):
+            if await request.is_disconnected():
+                cancel_token.cancel("disconnect")
+                raise RenderCancelled(cancel_token.reason, "upload")
+            
             content_type = (image_file.content_type or "").lower()
             if content_type not in ALLOWED_IMAGE_CONTENT_TYPES:
                 raise HTTPException(
@@ -168,36 +463,159 @@ async def generate_site_visit_pdf(
                     )
                 )
             
-            img_bytes = await image_file.read()
-            
-            if not image_processor.validate_image_size(img_bytes):
+            # Solo el tamaño: el contenido se lee de a una imagen durante el render
+            if not image_processor.validate_image_size(image_file.file):
                 raise HTTPException(
                     status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                     detail=f"Imagen {idx + 1} excede el tamaño máximo de {settings.MAX_IMAGE_SIZE_MB}MB"
                 )
-            
-            images_bytes.append(img_bytes)
         
-        pdf_bytes, metadata = pdf_generator.generate_site_visit_pdf(
-            site_visit_data,
-            images_bytes
+        # Los uploads quedan en sus archivos temporales (en disco si son grandes)
+        # y el render los lee de a uno: nunca están todos los originales en memoria
+        image_sources = [_take_upload_file(image_file) for image_file in images]
+        
+        api_key = request.headers.get(settings.RENDER_CLIENT_HEADER)
+        priority_class = render_scheduler.resolve_class(
+            request.headers.get(settings.RENDER_PRIORITY_HEADER),
+            api_key
+        )
+        client_id = api_key or (request.client.host if request.client else "anonymous")
+        
+        if recipients:
+            # Rechazar antes del 202: después el cliente ya no se entera de la falla
+            if _delivery_render_slots.locked() or not render_scheduler.has_capacity(priority_class):
+                release_image_sources(image_sources)
+                metrics.inc("delivery.rejected")
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Demasiados envíos por email pendientes, reintentar más tarde",
+                    headers={"Retry-After": "30"}
+                )
+            # Con un cupo libre acquire() no suspende: el cupo queda reservado
+            # antes del próximo await y peticiones simultáneas no lo comparten
+            await _delivery_render_slots.acquire()
+            try:
+                filename = pdf_generator.generate_filename(site_visit_data)
+                delivery_id = await delivery_queue.create(
+                    recipients,
+                    subject=f"Reporte de visita a obra #{site_visit_data.numero_visita} - {site_visit_data.nombre_planta}",
+                    body=(
+                        f"Se adjunta el reporte de la visita #{site_visit_data.numero_visita} "
+                        f"a {site_visit_data.nombre_planta} ({site_visit_data.fecha}).\n\n"
+                        "Documento generado automáticamente por el Sistema de Reportes."
+                    ),
+                    filename=f"{filename}.pdf"
+                )
+            except BaseException:
+                _delivery_render_slots.release()
+                release_image_sources(image_sources)
+                raise
+            task = asyncio.create_task(_render_for_delivery(
+                delivery_id,
+                site_visit_data,
+                image_sources,
+                priority_class,
+                client_id,
+                profile=render_profile,
+                photo_layout=photo_layout
+            ))
+            _delivery_renders.add(task)
+            task.add_done_callback(_delivery_renders.discard)
+            task.add_done_callback(lambda _: _delivery_render_slots.release())
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content={
+                    "delivery_id": delivery_id,
+                    "status": "rendering",
+                    "recipients": recipients,
+                    "status_url": f"/api/deliveries/{delivery_id}"
+                }
+            )
+        
+        render_started = time.perf_counter()
+        render_key = await asyncio.to_thread(
+            RenderCoalescer.key_for,
+            site_visit_data.model_dump_json(),
+            render_profile.name,
+            photo_layout,
+            images_bytes=image_sources
         )
         
+        handoff = _ImageHandoff(image_sources)
+        
+        async def start_render(flight_token: CancelToken):
+            pdf_file, metadata = await render_scheduler.submit(
+                handoff.render,
+                site_visit_data,
+                image_sources,
+                cancel_token=flight_token,
+                profile=render_profile,
+                photo_layout=photo_layout,
+                priority_class=priority_class,
+                client_id=client_id
+            )
+            return SharedFile(pdf_file), metadata
+        
+        flight, leader = render_coalescer.join(
+            render_key,
+            start_render,
+            share=lambda result, readers: result[0].share(readers)
+        )
+        if leader:
+            # Cola llena, trabajo retirado de la cola o tarea cancelada antes de
+            # empezar: el render nunca tomó los uploads y hay que cerrarlos aquí
+            flight.task.add_done_callback(lambda _: handoff.release_unstarted())
+        else:
+            # Este render ya está en curso con las imágenes de otra petición
+            release_image_sources(image_sources)
+        
+        try:
+            pdf_file, metadata = await _await_render(request, cancel_token, flight)
+        except SchedulerOverloaded as e:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=str(e),
+                headers={"Retry-After": "5"}
+            )
+        
+        render_ms = (time.perf_counter() - render_started) * 1000
+        if leader:
+            render_history.record(metadata, priority_class=priority_class, total_ms=render_ms)
+        
         filename = pdf_generator.generate_filename(site_visit_data)
         
-        return Response(
-            content=pdf_bytes,
+        return StreamingResponse(
+            pdf_file.iter_chunks(PDF_STREAM_CHUNK_BYTES),
             media_type="application/pdf",
+            background=BackgroundTask(pdf_file.release),
             headers={
                 "Content-Disposition": f'attachment; filename="{filename}.pdf"',
+                "Content-Length": str(metadata['pdf_size_bytes']),
                 "X-PDF-Size": str(metadata['pdf_size_bytes']),
                 "X-Images-Processed": str(metadata['images_count']),
-                "X-Compression-Ratio": str(metadata['total_compression_ratio'])
+                "X-Compression-Ratio": str(metadata['total_compression_ratio']),
+                "X-Render-Class": priority_class,
+                "X-Render-Profile": metadata['render_profile'],
+                "X-Photo-Layout": metadata['photo_layout'],
+                "X-Render-Coalesced": "false" if leader else "true",
+                "Server-Timing": _server_timing(metadata['stage_timings_ms'], render_ms)
             }
         )
     
     except HTTPException:
         raise
+    except RenderCancelled as e:
+        metrics.inc(f"render.cancelled.{e.reason}")
+        logger.info("Render abandonado: %s", e)
+        if e.reason == "deadline":
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="El PDF no se generó dentro del plazo de la petición"
+            )
+        raise HTTPException(
+            status_code=HTTP_499_CLIENT_CLOSED_REQUEST,
+            detail="Cliente desconectado"
+        )
     except Exception:
         logger.exception("Error generando PDF")
         raise HTTPException(
@@ -250,13 +668,12 @@ async def preview_site_visit_pdf(
                     )
                 )
 
-            img_bytes = await image_file.read()
-            if not image_processor.validate_image_size(img_bytes):
+            if not image_processor.validate_image_size(image_file.file):
                 raise HTTPException(
                     status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                     detail=f"Una o más imágenes exceden {settings.MAX_IMAGE_SIZE_MB}MB"
                 )
-            total_size += len(img_bytes)
+            total_size += image_source_size(image_file.file)
         
         estimated_size = int(total_size * 0.3)  # Después de compresión ~30%
         
@@ -279,6 +696,90 @@ async def preview_site_visit_pdf(
         )
 
 
+@app.post(
+    "/api/reports/site-visit/preview.png",
+    response_class=Response,
+    responses={
+        200: {
+            "content": {"image/png": {}},
+            "description": "Primera página del reporte como PNG"
+        },
+        400: {"description": "Error en validación de datos"},
+        429: {"description": "Cola de renders llena, reintentar más tarde"}
+    },
+    summary="Vista previa rápida de la primera página"
+)
+async def preview_site_visit_png(
+    request: Request,
+    data: str = Form(..., description="JSON con datos del formulario")
+):
+    """
+    Rasteriza la primera página del reporte (tabla de datos) a PNG
+    
+    No requiere imágenes: la página 1 solo contiene los datos del formulario.
+    El layout queda en caché unos minutos y el render completo que llegue
+    después con los mismos datos lo reutiliza.
+    """
+    try:
+        site_visit_data = SiteVisitData(**json.loads(data))
+    except json.JSONDecodeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"JSON inválido: {str(e)}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Error en validación de datos: {str(e)}"
+        )
+    
+    api_key = request.headers.get(settings.RENDER_CLIENT_HEADER)
+    priority_class = render_scheduler.resolve_class(
+        request.headers.get(settings.RENDER_PRIORITY_HEADER),
+        api_key
+    )
+    cancel_token = CancelToken(_request_timeout(request))
+    flight, _ = preview_coalescer.join(
+        RenderCoalescer.key_for(site_visit_data.model_dump_json()),
+        lambda flight_token: render_scheduler.submit(
+            pdf_generator.generate_preview_png,
+            site_visit_data,
+            priority_class=priority_class,
+            client_id=api_key or (request.client.host if request.client else "anonymous")
+        )
+    )
+    try:
+        png_bytes, metadata = await _await_render(request, cancel_token, flight)
+    except SchedulerOverloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": "5"}
+        )
+    except RenderCancelled as e:
+        metrics.inc(f"preview.cancelled.{e.reason}")
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT if e.reason == "deadline" else HTTP_499_CLIENT_CLOSED_REQUEST,
+            detail="Vista previa cancelada"
+        )
+    except Exception:
+        logger.exception("Error generando vista previa")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno generando vista previa"
+        )
+    
+    return Response(
+        content=png_bytes,
+        media_type="image/png",
+        headers={
+            "Cache-Control": "no-store",
+            "X-Preview-Cache-Hit": str(metadata['summary_cache_hit']).lower(),
+            "Server-Timing": f"preview;dur={metadata['elapsed_ms']:.1f}"
+        }
+    )
+
+
 @app.get("/api/config")
 async def get_config():
     """
@@ -288,10 +789,79 @@ async def get_config():
         "max_image_width": settings.MAX_IMAGE_WIDTH,
         "image_quality": settings.IMAGE_QUALITY,
         "max_image_size_mb": settings.MAX_IMAGE_SIZE_MB,
-        "supported_formats": ["JPEG", "PNG", "WebP"]
+        "supported_formats": ["JPEG", "PNG", "WebP"],
+        "render_profiles": sorted(RENDER_PROFILES),
+        "default_render_profile": settings.RENDER_DEFAULT_PROFILE,
+        "photo_layouts": list(PHOTO_LAYOUTS),
+        "default_photo_layout": settings.PHOTO_LAYOUT
+    }
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """
+    Métricas del servicio: contadores, tiempos de espera por clase y estado de colas
+    """
+    return {
+        **metrics.snapshot(),
+        "scheduler": render_scheduler.stats(),
+        "coalescing": {
+            "render": render_coalescer.stats(),
+            "preview": preview_coalescer.stats()
+        },
+        "delivery": await delivery_queue.stats() if delivery_queue.enabled else None
     }
 
 
+@app.get("/api/history/report")
+async def get_history_report(days: int = 30):
+    """
+    Resumen de latencia y compresión por versión del servicio y por día
+    
+    Útil para detectar regresiones de rendimiento después de un deploy
+    """
+    if not render_history.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Historial de renders desactivado (HISTORY_ENABLED=false)"
+        )
+    return await render_history.report(days=max(1, days))
+
+
+@app.get("/api/deliveries/{delivery_id}")
+async def get_delivery(delivery_id: str):
+    """
+    Estado de un envío por email (rendering, pending, sending, sent o failed)
+    """
+    if not delivery_queue.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Envío por email desactivado (DELIVERY_ENABLED=false)"
+        )
+    delivery = await delivery_queue.get(delivery_id)
+    if delivery is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Envío no encontrado"
+        )
+    return delivery
+
+
+@app.get("/api/debug/memory")
+async def get_memory_snapshots():
+    """
+    Snapshots de las asignaciones principales de los últimos renders
+    
+    Solo disponible con MEMORY_PROFILING=true
+    """
+    if not memory_profiler.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Instrumentación de memoria desactivada (MEMORY_PROFILING=false)"
+        )
+    return {"snapshots": memory_profiler.recent_snapshots()}
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,133 @@
+"""
+Instrumentación opcional de memoria por etapa (tracemalloc + RSS)
+
+Activada con MEMORY_PROFILING=true. Cada etapa registra el pico de memoria
+Python (tracemalloc) por encima de lo asignado al iniciar la etapa y la
+variación del RSS del proceso (los buffers de píxeles de Pillow y el layout
+de Pango se asignan en C y solo se ven en el RSS). tracemalloc es global al proceso: con
+RENDER_WORKERS > 1 las cifras de renders simultáneos se mezclan, para
+mediciones limpias usar RENDER_WORKERS=1.
+
+Las etapas se pueden anidar (ej. decode/resize de cada imagen dentro de la
+etapa images del render): el pico de una etapa interna se incorpora al de la
+etapa que la contiene, porque tracemalloc tiene un solo pico global que cada
+etapa reinicia al empezar.
+"""
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+from config import settings
+from metrics import metrics
+
+
+def current_rss_bytes() -> Optional[int]:
+    """RSS actual del proceso (Linux: /proc/self/statm; None si no está disponible)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryProfiler:
+    """Mide memoria por etapa y conserva snapshots de las últimas asignaciones"""
+
+    def __init__(self, enabled: bool = None, snapshots_kept: int = None, top: int = None):
+        """
+        Inicializa el profiler
+
+        Args:
+            enabled: Activar mediciones (default: config.MEMORY_PROFILING)
+            snapshots_kept: Renders recientes con snapshot (default: config.MEMORY_PROFILING_SNAPSHOTS)
+            top: Líneas con más asignaciones por snapshot (default: config.MEMORY_PROFILING_TOP)
+        """
+        self.enabled = settings.MEMORY_PROFILING if enabled is None else enabled
+        self.top = top or settings.MEMORY_PROFILING_TOP
+        self._snapshots = deque(maxlen=snapshots_kept or settings.MEMORY_PROFILING_SNAPSHOTS)
+        self._lock = threading.Lock()
+        # Pila de etapas abiertas por hilo: [pico_absoluto] de cada una
+        self._local = threading.local()
+
+    def _ensure_tracing(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(settings.MEMORY_PROFILING_FRAMES)
+
+    @contextmanager
+    def stage(self, name: str, record: Optional[dict], metric_prefix: str = "render"):
+        """
+        Mide la etapa envuelta y guarda el resultado en record[name]
+
+        Args:
+            name: Nombre de la etapa
+            record: Diccionario destino (None o profiler inactivo = no medir)
+            metric_prefix: Prefijo de las métricas publicadas
+        """
+        if not self.enabled or record is None:
+            yield
+            return
+
+        self._ensure_tracing()
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        start_traced, peak_so_far = tracemalloc.get_traced_memory()
+        if stack:
+            # reset_peak() borra el pico que la etapa externa venía midiendo
+            stack[-1][0] = max(stack[-1][0], peak_so_far)
+        tracemalloc.reset_peak()
+        frame = [start_traced]
+        stack.append(frame)
+        start_rss = current_rss_bytes()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, frame[0])
+            stack.pop()
+            if stack:
+                stack[-1][0] = max(stack[-1][0], peak)
+            end_rss = current_rss_bytes()
+            stats = {'tracemalloc_peak_kb': round(max(0, peak - start_traced) / 1024, 1)}
+            if start_rss is not None and end_rss is not None:
+                stats['rss_delta_kb'] = round((end_rss - start_rss) / 1024, 1)
+            record[name] = stats
+            metrics.observe(f"{metric_prefix}.memory_peak_kb.{name}", stats['tracemalloc_peak_kb'])
+            if 'rss_delta_kb' in stats:
+                metrics.observe(f"{metric_prefix}.rss_delta_kb.{name}", stats['rss_delta_kb'])
+
+    def take_snapshot(self, label: str) -> None:
+        """Guarda las líneas con más memoria asignada en este momento"""
+        if not self.enabled or not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        top_stats = snapshot.statistics('lineno')[:self.top]
+        with self._lock:
+            self._snapshots.append({
+                'label': label,
+                'taken_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'rss_kb': round((current_rss_bytes() or 0) / 1024, 1),
+                'top_allocations': [
+                    {
+                        'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                        'size_kb': round(stat.size / 1024, 1),
+                        'count': stat.count
+                    }
+                    for stat in top_stats
+                ]
+            })
+
+    def recent_snapshots(self) -> list:
+        """Snapshots de los últimos renders, del más reciente al más antiguo"""
+        with self._lock:
+            return list(reversed(self._snapshots))
+
+
+memory_profiler = MemoryProfiler()
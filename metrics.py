@@ -0,0 +1,83 @@
+"""
+Registro de métricas en memoria del servicio
+
+Contadores y distribuciones (ventana deslizante) para exponer en /api/metrics
+"""
+import threading
+from collections import deque
+from typing import Dict
+
+
+class MetricsRegistry:
+    """Registro thread-safe de contadores y distribuciones de valores"""
+
+    def __init__(self, window: int = 1000):
+        """
+        Inicializa el registro
+
+        Args:
+            window: Cantidad de observaciones recientes conservadas por distribución
+        """
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._samples: Dict[str, deque] = {}
+        self._totals: Dict[str, int] = {}
+
+    def inc(self, name: str, value: float = 1) -> None:
+        """Incrementa un contador"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        """Registra una observación en una distribución"""
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(value)
+            self._totals[name] = self._totals.get(name, 0) + 1
+
+    @staticmethod
+    def _percentile(sorted_values: list, percent: float) -> float:
+        index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+        return sorted_values[index]
+
+    def summary(self, name: str) -> dict:
+        """
+        Resume una distribución
+
+        Returns:
+            Diccionario con count, mean, p50, p95, p99 y max de la ventana
+        """
+        with self._lock:
+            values = sorted(self._samples.get(name, ()))
+            total = self._totals.get(name, 0)
+        if not values:
+            return {'count': total}
+        return {
+            'count': total,
+            'mean': round(sum(values) / len(values), 2),
+            'p50': round(self._percentile(values, 50), 2),
+            'p95': round(self._percentile(values, 95), 2),
+            'p99': round(self._percentile(values, 99), 2),
+            'max': round(values[-1], 2)
+        }
+
+    def snapshot(self) -> dict:
+        """
+        Retorna todas las métricas registradas
+
+        Returns:
+            Diccionario con 'counters' y 'distributions'
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            names = list(self._samples)
+        return {
+            'counters': counters,
+            'distributions': {name: self.summary(name) for name in sorted(names)}
+        }
+
+
+metrics = MetricsRegistry()
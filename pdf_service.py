@@ -1,17 +1,53 @@
 """
 Servicio de generación de PDFs usando WeasyPrint
 """
-from weasyprint import HTML
+from weasyprint import HTML, default_url_fetcher
 from jinja2 import Environment, FileSystemLoader, select_autoescape
-from typing import List
+from typing import BinaryIO, List, Optional
 import io
+import tempfile
+import time
 from pathlib import Path
 
 from models import SiteVisitData
-from image_processor import ImageProcessor
+from image_processor import ImageProcessor, ImageSource, release_image_sources
 from config import settings
+from cancellation import CancelToken
+from render_profiles import RenderProfile, get_profile
+from metrics import metrics
+from memory_profiler import memory_profiler
+from layout_cache import LayoutCache
 from datetime import datetime
 
+# Las fotos optimizadas se sirven a WeasyPrint desde memoria con este esquema
+# (en lugar de data URIs base64 dentro del HTML)
+PHOTO_URL_SCHEME = "photo:"
+
+PHOTO_LAYOUTS = ("grid", "contact_sheet")
+
+
+def get_photo_layout(name: Optional[str] = None) -> str:
+    """
+    Valida el modo de distribución de fotos
+    
+    Args:
+        name: "grid" o "contact_sheet" (default: config.PHOTO_LAYOUT)
+    
+    Returns:
+        Nombre normalizado del modo
+    
+    Raises:
+        ValueError: Si el modo no existe
+    """
+    key = (name or settings.PHOTO_LAYOUT).strip().lower()
+    if key not in PHOTO_LAYOUTS:
+        raise ValueError(
+            f"Distribución de fotos desconocida: '{name}'. "
+            f"Disponibles: {', '.join(PHOTO_LAYOUTS)}"
+        )
+    return key
+
+
 class PDFGenerator:
     """Generador de PDFs desde templates HTML"""
     
@@ -24,54 +60,294 @@ class PDFGenerator:
             autoescape=select_autoescape(['html', 'xml'])
         )
         self.image_processor = ImageProcessor()
+        # Resumen (página de datos) ya maquetado, compartido entre vista previa y render
+        self.summary_cache = LayoutCache()
     
     def generate_site_visit_pdf(
         self,
         data: SiteVisitData,
-        images_bytes: List[bytes]
-    ) -> tuple[bytes, dict]:
+        images_bytes: List[ImageSource],
+        cancel_token: Optional[CancelToken] = None,
+        profile: Optional[RenderProfile] = None,
+        photo_layout: Optional[str] = None
+    ) -> tuple[BinaryIO, dict]:
         """
         Genera PDF de reporte de visita a obra
         
+        El PDF se escribe en un archivo temporal "spooled" (en memoria hasta
+        PDF_SPOOL_MAX_MEMORY_MB, luego en disco) para no duplicar el documento
+        en memoria. El llamador debe cerrar el archivo.
+        
+        Las imágenes se optimizan una por una y cada original se libera en
+        cuanto existe su versión optimizada: al terminar, las posiciones de
+        images_bytes quedan en None. Los originales pueden ser archivos
+        abiertos (uploads en disco): se leen de a uno y el render los cierra,
+        también si falla o se cancela antes de llegar a ellos. El HTML solo referencia las fotos
+        (photo:N) y WeasyPrint las obtiene de memoria al hacer el layout.
+        
+        Con photo_layout="contact_sheet" las fotos de cada página se componen
+        en una sola imagen (con sus etiquetas) antes del layout: WeasyPrint
+        maqueta una imagen por página en lugar de una tarjeta por foto. Las
+        fotos no se codifican una por una: el tamaño optimizado y la
+        compresión de la metadata corresponden a las hojas.
+        
         Args:
             data: Datos del formulario validados
-            images_bytes: Lista de bytes de imágenes
+            images_bytes: Lista de imágenes, bytes o archivos (se consume)
+            cancel_token: Token consultado entre etapas para abandonar el render (opcional)
+            profile: Perfil de render (default: config.RENDER_DEFAULT_PROFILE)
+            photo_layout: "grid" o "contact_sheet" (default: config.PHOTO_LAYOUT)
         
         Returns:
-            Tuple de (pdf_bytes, metadata)
+            Tuple de (archivo_pdf posicionado al inicio, metadata)
+        
+        Raises:
+            RenderCancelled: Si el cliente se desconecta o vence el plazo
         """
-        processed_images, images_metadata = self.image_processor.process_images_for_pdf(
-            images_bytes
-        )
+        check = cancel_token.check if cancel_token is not None else (lambda stage: None)
+        if profile is None:
+            profile = get_profile()
+        photo_layout = get_photo_layout(photo_layout)
+        pdf_options = profile.weasyprint_options()
+        timings = {}
+        memory = {} if memory_profiler.enabled else None
+        stage_start = time.perf_counter()
+        
+        photos = []
+        images_metadata = []
+        sheets_metadata = []
+        with memory_profiler.stage('images', memory):
+            try:
+                if photo_layout == "contact_sheet":
+                    # Cada foto se redimensiona directo al tamaño de su celda y se pega
+                    # sin JPEG intermedio: la hoja es la única codificación
+                    box_width, box_height = self.image_processor.contact_sheet_photo_box()
+                    prepared = self.image_processor.iter_prepared_images(
+                        images_bytes,
+                        max_width=box_width,
+                        max_height=box_height,
+                        cancel_token=cancel_token,
+                        profile=profile,
+                        release_originals=True
+                    )
+                    
+                    def sheet_photos():
+                        for img, image_metadata in prepared:
+                            images_metadata.append(image_metadata)
+                            yield img
+                    
+                    for sheet_bytes, sheet_metadata in self.image_processor.iter_contact_sheets(
+                        sheet_photos(),
+                        cancel_token=cancel_token,
+                        profile=profile
+                    ):
+                        photos.append(sheet_bytes)
+                        sheets_metadata.append(sheet_metadata)
+                else:
+                    for optimized_bytes, image_metadata in self.image_processor.iter_images_for_pdf(
+                        images_bytes,
+                        cancel_token=cancel_token,
+                        profile=profile,
+                        release_originals=True
+                    ):
+                        photos.append(optimized_bytes)
+                        images_metadata.append(image_metadata)
+            finally:
+                # Cerrar los originales que no se llegaron a leer (error o cancelación)
+                release_image_sources(images_bytes)
+        stage_start = self._record_stage(timings, 'images', stage_start)
         
         total_original = sum(m['original_size_bytes'] for m in images_metadata)
-        total_optimized = sum(m['optimized_size_bytes'] for m in images_metadata)
+        # Bytes de imagen que se embeben en el PDF: fotos optimizadas u hojas de contactos
+        total_optimized = sum(
+            m['size_bytes'] for m in sheets_metadata
+        ) if photo_layout == "contact_sheet" else sum(
+            m['optimized_size_bytes'] for m in images_metadata
+        )
         
-        template = self.env.get_template('site_visit.html')
+        images_count = len(images_metadata)
+        if images_count < len(images_bytes):
+            metrics.inc("images.duplicates_dropped", len(images_bytes) - images_count)
         
-        html_content = template.render(
-            data=data,
-            images=processed_images,
-            total_images=len(processed_images)
-        )
-
-        pdf_io = io.BytesIO()
-        HTML(string=html_content, base_url=str(self.base_dir)).write_pdf(
-            target=pdf_io,
-            optimize_images=True
-        )
-        pdf_bytes = pdf_io.getvalue()
+        check("template")
+        with memory_profiler.stage('template', memory):
+            template = self.env.get_template('site_visit.html')
+            
+            html_content = template.render(
+                data=data,
+                images=[f"{PHOTO_URL_SCHEME}{idx}" for idx in range(len(photos))],
+                total_images=images_count,
+                contact_sheet=photo_layout == "contact_sheet",
+                section='photos'
+            )
+        stage_start = self._record_stage(timings, 'template', stage_start)
+        
+        # Layout y escritura separados para poder abandonar entre ambas etapas.
+        # El resumen y las fotos se maquetan como documentos separados (las fotos
+        # empiezan en página nueva de todos modos) para reutilizar el resumen
+        # que haya maquetado una vista previa reciente con los mismos datos.
+        # Mientras el render usa su propio resumen, una vista previa en paralelo con
+        # los mismos datos no lo vuelve a guardar en la caché
+        summary_key = self._summary_key(data)
+        check("layout")
+        try:
+            with memory_profiler.stage('layout', memory):
+                summary, summary_cache_hit = self._layout_summary(data, claim=True)
+                photos_document = HTML(
+                    string=html_content,
+                    base_url=str(self.base_dir),
+                    url_fetcher=self._photo_fetcher(photos)
+                ).render(**pdf_options)
+                document = summary.copy(summary.pages + photos_document.pages)
+                del html_content, photos, photos_document
+            stage_start = self._record_stage(timings, 'layout', stage_start)
+            
+            if memory_profiler.enabled:
+                # El árbol de layout vivo es el punto de mayor memoria del render; el
+                # snapshot se toma fuera de las etapas para no sumar su costo a ninguna
+                memory_profiler.take_snapshot(self.generate_filename(data))
+                stage_start = time.perf_counter()
+            
+            check("write")
+            with memory_profiler.stage('write', memory):
+                pdf_file = tempfile.SpooledTemporaryFile(
+                    max_size=settings.PDF_SPOOL_MAX_MEMORY_MB * 1024 * 1024
+                )
+                try:
+                    document.write_pdf(
+                        target=pdf_file,
+                        **pdf_options
+                    )
+                except BaseException:
+                    pdf_file.close()
+                    raise
+                pdf_size = pdf_file.tell()
+                pdf_file.seek(0)
+            self._record_stage(timings, 'write', stage_start)
+        finally:
+            self.summary_cache.release(summary_key)
         
         metadata = {
-            'pdf_size_bytes': len(pdf_bytes),
-            'images_count': len(images_bytes),
+            'pdf_size_bytes': pdf_size,
+            'images_count': images_count,
             'total_original_images_size': total_original,
             'total_optimized_images_size': total_optimized,
             'total_compression_ratio': round(total_original / total_optimized, 2) if total_optimized > 0 else 0,
+            'duplicates_dropped': len(images_bytes) - images_count,
+            'duplicates_flagged': sum(1 for m in images_metadata if 'duplicate_of' in m),
+            'render_profile': profile.name,
+            'photo_layout': photo_layout,
+            'contact_sheets': sheets_metadata,
+            'summary_cache_hit': summary_cache_hit,
+            'stage_timings_ms': timings,
             'images_metadata': images_metadata
         }
+        if memory is not None:
+            metadata['memory_stages'] = memory
+        
+        return pdf_file, metadata
+    
+    def _layout_summary(self, data: SiteVisitData, claim: bool = False):
+        """
+        Maqueta (o retira de la caché) el resumen: encabezado y tablas de datos
+        
+        El documento se retira de la caché: el llamador lo usa en exclusiva y
+        decide si lo devuelve (solo la vista previa lo hace).
+        
+        Args:
+            data: Datos del formulario validados
+            claim: Reclamar la clave en la caché (render completo); el llamador
+                debe liberarla con summary_cache.release()
+        
+        Returns:
+            Tuple de (Document de WeasyPrint, si vino de la caché)
+        """
+        document = self.summary_cache.pop(self._summary_key(data), claim=claim)
+        if document is not None:
+            metrics.inc("layout_cache.hits")
+            return document, True
+        
+        metrics.inc("layout_cache.misses")
+        html_content = self.env.get_template('site_visit.html').render(
+            data=data,
+            images=[],
+            total_images=0,
+            section='summary'
+        )
+        document = HTML(string=html_content, base_url=str(self.base_dir)).render()
+        return document, False
+    
+    @staticmethod
+    def _summary_key(data: SiteVisitData) -> str:
+        return LayoutCache.key_for(data.model_dump_json())
+    
+    def generate_preview_png(self, data: SiteVisitData, dpi: int = None) -> tuple[bytes, dict]:
+        """
+        Genera la primera página del reporte (tabla de datos) como PNG
+        
+        Solo maqueta el resumen, sin fotos, y rasteriza la página 1. El
+        layout queda en caché para que el render completo con los mismos
+        datos lo reutilice (y lo retire: el render completo no lo devuelve).
+        Si ese render ya empezó su layout, el resumen no se guarda.
+        
+        Args:
+            data: Datos del formulario validados
+            dpi: Resolución del PNG (default: config.PREVIEW_DPI)
+        
+        Returns:
+            Tuple de (png_bytes, metadata)
+        """
+        # Import diferido: pypdfium2 solo es necesario para la vista previa
+        import pypdfium2 as pdfium
+        
+        if dpi is None:
+            dpi = settings.PREVIEW_DPI
+        started = time.perf_counter()
+        
+        summary, cache_hit = self._layout_summary(data)
+        first_page_pdf = summary.copy(summary.pages[:1]).write_pdf()
+        if not self.summary_cache.put(self._summary_key(data), summary):
+            # Un render completo con los mismos datos ya maquetó su propio resumen
+            metrics.inc("layout_cache.discarded")
         
-        return pdf_bytes, metadata
+        pdf = pdfium.PdfDocument(first_page_pdf)
+        try:
+            page_image = pdf[0].render(scale=dpi / 72).to_pil()
+        finally:
+            pdf.close()
+        
+        output = io.BytesIO()
+        page_image.save(output, format='PNG')
+        
+        metadata = {
+            'dpi': dpi,
+            'dimensions': page_image.size,
+            'summary_pages': len(summary.pages),
+            'summary_cache_hit': cache_hit,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+        metrics.observe("preview.elapsed_ms", metadata['elapsed_ms'])
+        return output.getvalue(), metadata
+    
+    @staticmethod
+    def _photo_fetcher(photos: List[bytes]):
+        """url_fetcher de WeasyPrint que resuelve photo:N desde la lista en memoria"""
+        def fetcher(url: str) -> dict:
+            if url.startswith(PHOTO_URL_SCHEME):
+                return {
+                    'string': photos[int(url[len(PHOTO_URL_SCHEME):])],
+                    'mime_type': 'image/jpeg'
+                }
+            return default_url_fetcher(url)
+        return fetcher
+    
+    @staticmethod
+    def _record_stage(timings: dict, stage: str, started: float) -> float:
+        """Registra la duración de una etapa y retorna el inicio de la siguiente"""
+        now = time.perf_counter()
+        timings[stage] = round((now - started) * 1000, 1)
+        metrics.observe(f"render.stage_ms.{stage}", timings[stage])
+        return now
     
     def generate_filename(self, data: SiteVisitData) -> str:
         """
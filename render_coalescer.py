@@ -0,0 +1,161 @@
+"""
+Coalescencia de renders idénticos en curso (single-flight)
+
+Un doble clic en "Generar" o el reintento de una integración tras un timeout
+del cliente llegan mientras el primer render sigue corriendo. Las peticiones
+con la misma clave (datos del formulario, opciones y digest de cada imagen)
+se suman al render en curso y comparten su resultado en vez de iniciar otro.
+El render solo se cancela cuando se retiran todas las peticiones que lo esperan.
+"""
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+from cancellation import CancelToken
+from image_processor import ImageSource, iter_image_source_chunks
+from metrics import metrics
+
+
+class SharedFile:
+    """Archivo de resultado leído por varias respuestas; se cierra al liberarlo la última"""
+
+    def __init__(self, file_obj: BinaryIO):
+        self._file = file_obj
+        self._lock = threading.Lock()
+        self._readers = 0
+
+    def share(self, readers: int) -> None:
+        """Fija cuántas respuestas leerán el archivo (0 = cerrarlo ya)"""
+        with self._lock:
+            self._readers = readers
+            if readers <= 0:
+                self._file.close()
+
+    def iter_chunks(self, chunk_size: int) -> Iterator[bytes]:
+        """Lee el archivo por bloques con posición propia (lectores concurrentes)"""
+        offset = 0
+        while True:
+            with self._lock:
+                self._file.seek(offset)
+                chunk = self._file.read(chunk_size)
+            if not chunk:
+                return
+            offset += len(chunk)
+            yield chunk
+
+    def release(self) -> None:
+        """Un lector terminó; el último cierra el archivo"""
+        with self._lock:
+            self._readers -= 1
+            if self._readers <= 0:
+                self._file.close()
+
+
+class Flight:
+    """Render en curso compartido por las peticiones con la misma clave"""
+
+    def __init__(self, key: str, coalescer: "RenderCoalescer"):
+        self.key = key
+        self.cancel_token = CancelToken()
+        self.waiters = 1
+        self.task: Optional[asyncio.Future] = None
+        self._coalescer = coalescer
+
+    def leave(self, reason: str) -> None:
+        """
+        Retira una petición que dejó de esperar (desconexión o plazo)
+
+        Si era la última, el render se cancela y deja de aceptar nuevas peticiones.
+        """
+        if self.task.done():
+            return
+        self.waiters -= 1
+        if self.waiters <= 0:
+            self._coalescer._forget(self)
+            self.cancel_token.cancel(reason)
+            self.task.cancel()
+
+
+class RenderCoalescer:
+    """Registro de renders en curso por clave"""
+
+    def __init__(self, name: str = "render"):
+        """
+        Inicializa el registro
+
+        Args:
+            name: Prefijo de las métricas ({name}.coalesced, {name}.flights)
+        """
+        self.name = name
+        self._flights: Dict[str, Flight] = {}
+
+    @staticmethod
+    def key_for(*parts: str, images_bytes: Optional[List[ImageSource]] = None) -> str:
+        """
+        Clave de coalescencia: partes textuales más el digest de cada imagen en orden
+
+        Las imágenes pueden ser bytes o archivos abiertos (uploads en disco),
+        que se leen por bloques y quedan posicionados al inicio. Bloqueante con
+        muchas imágenes grandes; llamarla fuera del event loop.
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        for image in images_bytes or ():
+            image_digest = hashlib.sha256()
+            for chunk in iter_image_source_chunks(image):
+                image_digest.update(chunk)
+            digest.update(image_digest.digest())
+        return digest.hexdigest()
+
+    def join(
+        self,
+        key: str,
+        start: Callable[[CancelToken], Awaitable[Any]],
+        share: Optional[Callable[[Any, int], None]] = None
+    ) -> tuple[Flight, bool]:
+        """
+        Se suma al render en curso con esa clave o inicia uno nuevo
+
+        Args:
+            key: Clave de coalescencia (ver key_for)
+            start: Crea el render recibiendo el CancelToken compartido del flight
+            share: Llamado con (resultado, peticiones_esperando) al terminar con
+                   éxito, para que el resultado sepa cuántas veces se consumirá
+
+        Returns:
+            Tuple de (flight, si esta petición inició el render)
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            flight.waiters += 1
+            metrics.inc(f"{self.name}.coalesced")
+            return flight, False
+
+        flight = Flight(key, self)
+        flight.task = asyncio.ensure_future(start(flight.cancel_token))
+        flight.task.add_done_callback(lambda task: self._finish(flight, task, share))
+        self._flights[key] = flight
+        metrics.inc(f"{self.name}.flights")
+        return flight, True
+
+    def _forget(self, flight: Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def _finish(self, flight: Flight, task: asyncio.Future, share) -> None:
+        # Corre antes de despertar a las peticiones en espera: waiters es exacto
+        self._forget(flight)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if share is not None:
+            share(task.result(), flight.waiters)
+
+    def stats(self) -> dict:
+        """Renders en curso y peticiones esperando en ellos"""
+        return {
+            'in_flight': len(self._flights),
+            'waiting_requests': sum(f.waiters for f in self._flights.values())
+        }
@@ -0,0 +1,248 @@
+"""
+Historial local de rendimiento de renders (SQLite)
+
+Cada render exitoso se encola en memoria y un task en segundo plano lo
+escribe por lotes, fuera del event loop. La retención está acotada por días
+y por cantidad de filas. El reporte resume latencia y compresión por versión
+del servicio y por día para detectar regresiones tras un deploy.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+
+from config import settings
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('images', 'template', 'layout', 'write')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS renders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    day TEXT NOT NULL,
+    version TEXT NOT NULL,
+    profile TEXT,
+    priority_class TEXT,
+    images_count INTEGER,
+    input_bytes INTEGER,
+    optimized_bytes INTEGER,
+    pdf_bytes INTEGER,
+    compression_ratio REAL,
+    total_ms REAL,
+    queue_ms REAL,
+    images_ms REAL,
+    template_ms REAL,
+    layout_ms REAL,
+    write_ms REAL,
+    metadata_json TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_renders_created_at ON renders (created_at);
+CREATE INDEX IF NOT EXISTS idx_renders_version_day ON renders (version, day);
+"""
+
+
+def _percentile(sorted_values: list, percent: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class RenderHistoryStore:
+    """Almacén SQLite de métricas por render con escrituras por lotes"""
+
+    def __init__(self, path: str = None):
+        """
+        Inicializa el almacén (la base se crea en la primera escritura)
+
+        Args:
+            path: Ruta del archivo SQLite (default: config.HISTORY_DB_PATH)
+        """
+        self.path = Path(path or settings.HISTORY_DB_PATH)
+        self.enabled = settings.HISTORY_ENABLED
+        self._pending: list = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._initialized = False
+        self._last_prune = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        if not self._initialized:
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        return conn
+
+    def record(
+        self,
+        metadata: dict,
+        priority_class: str = None,
+        total_ms: float = None
+    ) -> None:
+        """
+        Encola un render para escribirlo en el próximo lote (no bloquea)
+
+        Args:
+            metadata: Metadata retornada por PDFGenerator.generate_site_visit_pdf
+            priority_class: Clase de prioridad del render
+            total_ms: Tiempo total del render incluyendo espera en cola
+        """
+        if not self.enabled:
+            return
+        if len(self._pending) >= settings.HISTORY_MAX_PENDING:
+            metrics.inc("history.dropped")
+            return
+
+        timings = metadata.get('stage_timings_ms', {})
+        queue_ms = None
+        if total_ms is not None:
+            queue_ms = max(0.0, total_ms - sum(timings.values()))
+        now = time.time()
+        self._pending.append((
+            now,
+            time.strftime('%Y-%m-%d', time.gmtime(now)),
+            settings.APP_VERSION,
+            metadata.get('render_profile'),
+            priority_class,
+            metadata.get('images_count'),
+            metadata.get('total_original_images_size'),
+            metadata.get('total_optimized_images_size'),
+            metadata.get('pdf_size_bytes'),
+            metadata.get('total_compression_ratio'),
+            total_ms,
+            queue_ms,
+            *(timings.get(stage) for stage in STAGES),
+            json.dumps(metadata, default=str)
+        ))
+        if self._wakeup is not None and len(self._pending) >= settings.HISTORY_BATCH_SIZE:
+            self._wakeup.set()
+
+    def _write_batch(self, rows: list) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO renders (created_at, day, version, profile, priority_class, "
+                    "images_count, input_bytes, optimized_bytes, pdf_bytes, compression_ratio, "
+                    "total_ms, queue_ms, images_ms, template_ms, layout_ms, write_ms, metadata_json) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                if time.time() - self._last_prune > settings.HISTORY_PRUNE_SECONDS:
+                    self._prune(conn)
+                    self._last_prune = time.time()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _prune(conn: sqlite3.Connection) -> None:
+        """Aplica la retención por antigüedad y por cantidad de filas"""
+        cutoff = time.time() - settings.HISTORY_RETENTION_DAYS * 86400
+        conn.execute("DELETE FROM renders WHERE created_at < ?", (cutoff,))
+        conn.execute(
+            "DELETE FROM renders WHERE id <= ("
+            "SELECT id FROM renders ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (settings.HISTORY_MAX_ROWS,)
+        )
+
+    async def flush(self) -> None:
+        """Escribe los renders pendientes en un hilo aparte"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+            metrics.inc("history.written", len(batch))
+        except Exception:
+            metrics.inc("history.write_errors")
+            logger.exception("Error escribiendo historial de renders")
+
+    async def run(self) -> None:
+        """Loop de escritura por lotes (task en segundo plano durante la vida de la app)"""
+        self._wakeup = asyncio.Event()
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.HISTORY_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def stop(self) -> None:
+        """Detiene el loop y escribe lo pendiente"""
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        await self.flush()
+
+    def _query_report(self, days: int) -> dict:
+        cutoff = time.time() - days * 86400
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT version, day, total_ms, queue_ms, images_ms, template_ms, layout_ms, "
+                "write_ms, compression_ratio, pdf_bytes, images_count "
+                "FROM renders WHERE created_at >= ? ORDER BY created_at",
+                (cutoff,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        groups = {'by_version': defaultdict(list), 'by_day': defaultdict(list)}
+        for row in rows:
+            groups['by_version'][row[0]].append(row)
+            groups['by_day'][(row[1], row[0])].append(row)
+
+        def summarize(group_rows: list) -> dict:
+            latencies = sorted(r[2] for r in group_rows if r[2] is not None)
+            summary = {'renders': len(group_rows)}
+            if latencies:
+                summary.update({
+                    'latency_p50_ms': round(_percentile(latencies, 50), 1),
+                    'latency_p95_ms': round(_percentile(latencies, 95), 1),
+                    'latency_max_ms': round(latencies[-1], 1)
+                })
+            for idx, stage in enumerate(('queue',) + STAGES, start=3):
+                values = [r[idx] for r in group_rows if r[idx] is not None]
+                if values:
+                    summary[f'{stage}_mean_ms'] = round(sum(values) / len(values), 1)
+            for idx, name in ((8, 'compression_ratio_mean'), (9, 'pdf_bytes_mean'), (10, 'images_mean')):
+                values = [r[idx] for r in group_rows if r[idx] is not None]
+                if values:
+                    summary[name] = round(sum(values) / len(values), 2)
+            return summary
+
+        return {
+            'days': days,
+            'by_version': {
+                version: summarize(group)
+                for version, group in groups['by_version'].items()
+            },
+            'by_day': [
+                {'day': day, 'version': version, **summarize(group)}
+                for (day, version), group in sorted(groups['by_day'].items())
+            ]
+        }
+
+    async def report(self, days: int = 30) -> dict:
+        """
+        Resume latencia y compresión por versión y por día
+
+        Args:
+            days: Ventana de días hacia atrás
+
+        Returns:
+            Diccionario con 'by_version' y 'by_day'
+        """
+        await self.flush()
+        return await asyncio.to_thread(self._query_report, days)
+
+
+render_history = RenderHistoryStore()
@@ -0,0 +1,77 @@
+"""
+Perfiles de renderizado seleccionables por petición
+
+- final: máxima compresión para reportes archivados (comportamiento histórico)
+- draft: prioriza latencia para revisión en sitio (archivo más grande)
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from PIL import Image
+
+from config import settings
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """Opciones de imagen y de WeasyPrint aplicadas a un render"""
+
+    name: str
+    resample: Image.Resampling  # Filtro de redimensionado
+    jpeg_optimize: bool  # Pasada extra de Huffman óptimo en JPEG
+    jpeg_progressive: bool
+    optimize_images: bool  # Optimización de imágenes de WeasyPrint
+    compress_pdf: bool  # Compresión de streams del PDF
+    subset_fonts: bool  # Incrustar solo los glifos usados
+
+    def weasyprint_options(self) -> dict:
+        """Opciones para HTML.render() / Document.write_pdf()"""
+        return {
+            'optimize_images': self.optimize_images,
+            'uncompressed_pdf': not self.compress_pdf,
+            'full_fonts': not self.subset_fonts
+        }
+
+
+RENDER_PROFILES = {
+    'final': RenderProfile(
+        name='final',
+        resample=Image.Resampling.LANCZOS,
+        jpeg_optimize=True,
+        jpeg_progressive=False,
+        optimize_images=True,
+        compress_pdf=True,
+        subset_fonts=True
+    ),
+    'draft': RenderProfile(
+        name='draft',
+        resample=Image.Resampling.BILINEAR,
+        jpeg_optimize=False,
+        jpeg_progressive=False,
+        optimize_images=False,
+        compress_pdf=False,
+        subset_fonts=False
+    ),
+}
+
+
+def get_profile(name: Optional[str] = None) -> RenderProfile:
+    """
+    Obtiene un perfil por nombre
+
+    Args:
+        name: Nombre del perfil (default: config.RENDER_DEFAULT_PROFILE)
+
+    Returns:
+        RenderProfile correspondiente
+
+    Raises:
+        ValueError: Si el perfil no existe
+    """
+    key = (name or settings.RENDER_DEFAULT_PROFILE).strip().lower()
+    if key not in RENDER_PROFILES:
+        raise ValueError(
+            f"Perfil de render desconocido: '{name}'. "
+            f"Disponibles: {', '.join(sorted(RENDER_PROFILES))}"
+        )
+    return RENDER_PROFILES[key]
@@ -0,0 +1,257 @@
+"""
+Planificador de renderizado con clases de prioridad y cola justa por cliente
+
+Los renders se ejecutan en un pool de hilos para no bloquear el event loop.
+Cada clase de prioridad (ej. interactive, bulk) tiene una cuota de
+concurrencia proporcional al pool que se aplica solo cuando las clases
+compiten: un slot libre lo toma la clase con trabajo pendiente menos atendida
+respecto de su cuota, aunque otra clase no lo esté usando. Cada clase tiene
+su propio límite de espera, así que un lote masivo no provoca 429 en las
+peticiones interactivas. Dentro de cada clase los clientes se atienden por
+turnos (round-robin), de modo que un cliente no acapara la cola de los demás.
+"""
+import asyncio
+import functools
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from config import settings
+from metrics import metrics
+from cancellation import RenderCancelled
+
+
+class SchedulerOverloaded(Exception):
+    """La cola de renders está llena; el cliente debe reintentar más tarde"""
+
+
+@dataclass
+class _Job:
+    fn: Callable[..., Any]
+    priority_class: str
+    client_id: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class RenderScheduler:
+    """Pool de renders con cuotas por clase y turnos por cliente"""
+
+    def __init__(
+        self,
+        workers: int = None,
+        class_shares: Dict[str, int] = None,
+        queue_max: int = None
+    ):
+        """
+        Inicializa el planificador
+
+        Args:
+            workers: Renders simultáneos (default: config.RENDER_WORKERS)
+            class_shares: Peso de concurrencia por clase (default: config.RENDER_CLASS_SHARES)
+            queue_max: Máximo de renders en espera por clase (default: config.RENDER_QUEUE_MAX)
+        """
+        self.workers = workers or settings.RENDER_WORKERS
+        shares = class_shares or settings.RENDER_CLASS_SHARES
+        self.queue_max = queue_max or settings.RENDER_QUEUE_MAX
+
+        if not shares or any(share <= 0 for share in shares.values()):
+            raise ValueError("RENDER_CLASS_SHARES debe definir al menos una clase y cuotas mayores que 0")
+        if settings.RENDER_DEFAULT_CLASS not in shares:
+            raise ValueError(
+                f"RENDER_DEFAULT_CLASS '{settings.RENDER_DEFAULT_CLASS}' "
+                "no está definida en RENDER_CLASS_SHARES"
+            )
+
+        total_share = sum(shares.values())
+        # Slots que le corresponden a cada clase cuando compite con otras (mínimo 1);
+        # no es un límite: sin competencia una clase puede usar todo el pool
+        self.guaranteed_slots = {
+            name: max(1, round(self.workers * share / total_share))
+            for name, share in shares.items()
+        }
+        self.class_shares = dict(shares)
+
+        self._queues: Dict[str, "OrderedDict[str, deque]"] = {
+            name: OrderedDict() for name in shares
+        }
+        self._running: Dict[str, int] = {name: 0 for name in shares}
+        self._queued = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Referencias a las tareas en curso (asyncio solo guarda referencias débiles)
+        self._tasks: set = set()
+
+    def resolve_class(self, requested: Optional[str], api_key: Optional[str] = None) -> str:
+        """
+        Determina la clase de prioridad de una petición
+
+        Args:
+            requested: Clase pedida por el cliente (header)
+            api_key: API key del cliente, si está mapeada a una clase tiene precedencia
+
+        Returns:
+            Nombre de una clase configurada
+        """
+        if api_key and api_key in settings.RENDER_API_KEY_CLASSES:
+            requested = settings.RENDER_API_KEY_CLASSES[api_key]
+        if requested and requested.lower() in self._queues:
+            return requested.lower()
+        return settings.RENDER_DEFAULT_CLASS
+
+    async def submit(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        priority_class: str,
+        client_id: str,
+        **kwargs
+    ) -> Any:
+        """
+        Encola un render y espera su resultado
+
+        Args:
+            fn: Función bloqueante a ejecutar en el pool
+            priority_class: Clase de prioridad de la petición
+            client_id: Identificador del cliente para la cola justa
+
+        Returns:
+            Resultado de fn(*args, **kwargs)
+
+        Raises:
+            SchedulerOverloaded: Si la cola de espera de la clase está llena
+        """
+        if not self.has_capacity(priority_class):
+            metrics.inc(f"render.rejected.{priority_class}")
+            raise SchedulerOverloaded(
+                f"Cola de renders '{priority_class}' llena "
+                f"({self._class_queued(priority_class)} en espera)"
+            )
+
+        loop = asyncio.get_running_loop()
+        job = _Job(
+            fn=functools.partial(fn, *args, **kwargs),
+            priority_class=priority_class,
+            client_id=client_id,
+            future=loop.create_future()
+        )
+        self._queues[priority_class].setdefault(client_id, deque()).append(job)
+        self._queued += 1
+        metrics.inc(f"render.submitted.{priority_class}")
+        self._dispatch()
+
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            self._discard(job)
+            raise
+
+    def has_capacity(self, priority_class: str) -> bool:
+        """Indica si la cola de la clase admite otro render sin responder 429"""
+        return self._class_queued(priority_class) < self.queue_max
+
+    def _class_queued(self, priority_class: str) -> int:
+        return sum(len(q) for q in self._queues[priority_class].values())
+
+    def _discard(self, job: _Job) -> None:
+        """Retira de la cola un trabajo cuyo solicitante ya no espera"""
+        client_queue = self._queues[job.priority_class].get(job.client_id)
+        if client_queue and job in client_queue:
+            client_queue.remove(job)
+            self._queued -= 1
+            if not client_queue:
+                del self._queues[job.priority_class][job.client_id]
+
+    def _next_class(self) -> Optional[str]:
+        """
+        Clase con trabajo pendiente y menor ocupación relativa a su cuota
+
+        Sin límite duro: si solo una clase tiene trabajo pendiente toma los
+        slots libres; las cuotas deciden el reparto cuando varias compiten.
+        """
+        candidates = [name for name, queue in self._queues.items() if queue]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda name: self._running[name] / self.class_shares[name])
+
+    def _dispatch(self) -> None:
+        """Inicia trabajos en espera mientras haya slots libres"""
+        while sum(self._running.values()) < self.workers:
+            priority_class = self._next_class()
+            if priority_class is None:
+                return
+
+            # Round-robin: atender al primer cliente y pasarlo al final de la fila
+            clients = self._queues[priority_class]
+            client_id, client_queue = next(iter(clients.items()))
+            job = client_queue.popleft()
+            if client_queue:
+                clients.move_to_end(client_id)
+            else:
+                del clients[client_id]
+            self._queued -= 1
+
+            wait_ms = (time.perf_counter() - job.enqueued_at) * 1000
+            metrics.observe(f"render.queue_wait_ms.{priority_class}", wait_ms)
+
+            self._running[priority_class] += 1
+            task = asyncio.get_running_loop().create_task(self._run(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: _Job) -> None:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="render"
+            )
+        started = time.perf_counter()
+        # completed | failed | abandoned (cancelado o vencido durante el render)
+        outcome = "abandoned"
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, job.fn)
+        except RenderCancelled as exc:
+            metrics.inc(f"render.aborted.{exc.stage}")
+            if not job.future.done():
+                job.future.set_exception(exc)
+        except Exception as exc:
+            outcome = "failed"
+            if not job.future.done():
+                job.future.set_exception(exc)
+        else:
+            outcome = "completed"
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            # Soltar los argumentos (imágenes) aunque alguien conserve la referencia al job
+            job.fn = None
+            metrics.observe(
+                f"render.run_ms.{job.priority_class}",
+                (time.perf_counter() - started) * 1000
+            )
+            metrics.inc(f"render.{outcome}.{job.priority_class}")
+            self._running[job.priority_class] -= 1
+            self._dispatch()
+
+    def stats(self) -> dict:
+        """Estado actual de colas y slots por clase"""
+        return {
+            'workers': self.workers,
+            'queued': self._queued,
+            'classes': {
+                name: {
+                    'guaranteed_slots': self.guaranteed_slots[name],
+                    'running': self._running[name],
+                    'queued': self._class_queued(name),
+                    'clients_waiting': len(self._queues[name])
+                }
+                for name in self._queues
+            }
+        }
+
+    def shutdown(self) -> None:
+        """Libera el pool de hilos"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,352 @@
+"""
+Render por lotes sin pasar por HTTP (re-generar archivos históricos)
+
+Lee los reportes de un manifiesto JSONL o de un directorio y los renderiza
+con PDFGenerator en un pool de procesos. Cada PDF se acompaña de un archivo
+.sha256 con el hash de sus entradas (datos, imágenes, opciones, templates y
+configuración de imágenes); si el hash no cambió el reporte se omite.
+
+Manifiesto JSONL, una línea por reporte (rutas relativas al manifiesto):
+    {"data": {...SiteVisitData...}, "images": ["fotos/1.jpg", "fotos/2.jpg"],
+     "output": "opcional_nombre", "profile": "final", "photo_layout": "grid"}
+
+Directorio: cada subdirectorio con un data.json (mismos campos que "data", o
+el objeto completo de una línea del manifiesto) y sus imágenes; si no lista
+"images" se usan las imágenes del subdirectorio en orden alfabético.
+
+En lote "fecha" es obligatoria: un reporte histórico no debe tomar la fecha
+de hoy (cambiaría su nombre y su hash cada día). Si dos reportes resuelven al
+mismo PDF, ambos llevan como sufijo su origen (subdirectorio o línea).
+
+Uso:
+    python scripts/batch_render.py archivo.jsonl --output pdfs/
+    python scripts/batch_render.py visitas/ --output pdfs/ --workers 8 --profile draft
+    python scripts/batch_render.py archivo.jsonl --output pdfs/ --force
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+HASH_SUFFIX = ".sha256"
+UNSAFE_NAME_CHARS = re.compile(r"[^A-Za-z0-9_-]+")
+
+# Generador por proceso del pool (se crea una vez en el initializer)
+_generator = None
+_environment = ""
+
+
+@dataclass
+class Job:
+    """Reporte a renderizar"""
+    source: str  # Línea del manifiesto o subdirectorio, para los mensajes
+    data: dict
+    images: List[str]
+    output: Optional[str] = None
+    profile: Optional[str] = None
+    photo_layout: Optional[str] = None
+
+
+@dataclass
+class JobResult:
+    """Resultado de un reporte"""
+    source: str
+    status: str  # rendered | skipped | failed
+    output: Optional[str] = None
+    elapsed_ms: float = 0.0
+    pdf_size_bytes: int = 0
+    stage_timings_ms: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def _job_from_record(record: dict, base_dir: Path, source: str) -> Job:
+    if 'data' not in record:
+        # data.json con solo los campos del formulario
+        record = {'data': record}
+    return Job(
+        source=source,
+        data=record['data'],
+        images=[str((base_dir / path).resolve()) for path in record.get('images', [])],
+        output=record.get('output'),
+        profile=record.get('profile'),
+        photo_layout=record.get('photo_layout')
+    )
+
+
+def load_jobs(input_path: Path) -> List[Job]:
+    """Lee los reportes de un manifiesto JSONL o de un directorio de reportes"""
+    jobs = []
+    if input_path.is_dir():
+        for report_dir in sorted(p for p in input_path.iterdir() if p.is_dir()):
+            data_file = report_dir / "data.json"
+            if not data_file.exists():
+                continue
+            job = _job_from_record(json.loads(data_file.read_text(encoding='utf-8')), report_dir, str(report_dir))
+            if not job.images:
+                job.images = [
+                    str(p.resolve()) for p in sorted(report_dir.iterdir())
+                    if p.suffix.lower() in IMAGE_EXTENSIONS
+                ]
+            jobs.append(job)
+        return jobs
+
+    with open(input_path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if line.strip():
+                jobs.append(_job_from_record(json.loads(line), input_path.parent, f"{input_path.name}:{line_number}"))
+    return jobs
+
+
+def _environment_digest() -> str:
+    """Hash de lo que cambia el PDF además de las entradas: templates y configuración de imágenes"""
+    from config import settings
+
+    digest = hashlib.sha256()
+    for template in sorted((ROOT / "templates").glob("*.html")):
+        digest.update(template.read_bytes())
+    for name in ('MAX_IMAGE_WIDTH', 'IMAGE_QUALITY', 'DEDUP_MODE', 'DEDUP_SIMILARITY_THRESHOLD',
+                 'CONTACT_SHEET_COLUMNS', 'CONTACT_SHEET_ROWS', 'CONTACT_SHEET_WIDTH'):
+        digest.update(f"{name}={getattr(settings, name)}".encode())
+    return digest.hexdigest()
+
+
+def _init_worker(environment_digest: str) -> None:
+    global _generator, _environment
+    from pdf_service import PDFGenerator
+
+    _generator = PDFGenerator()
+    _environment = environment_digest
+
+
+def validate_job(job: Job):
+    """
+    Valida los datos de un reporte para render en lote
+
+    Raises:
+        ValueError: Si falta "fecha" o los datos no son válidos
+    """
+    from models import SiteVisitData
+
+    if not job.data.get('fecha'):
+        raise ValueError("Falta 'fecha': en lote no se usa la fecha de hoy")
+    return SiteVisitData(**job.data)
+
+
+def assign_outputs(jobs: List[Job], generator) -> List[str]:
+    """
+    Resuelve el nombre de salida de cada reporte antes de repartirlos al pool
+
+    Los nombres que coinciden (sin distinguir mayúsculas) llevan como sufijo
+    el origen de cada reporte, así ninguno pisa el PDF de otro.
+
+    Returns:
+        Orígenes de los reportes renombrados
+    """
+    by_name: Dict[str, List[Job]] = {}
+    for job in jobs:
+        job.output = job.output or generator.generate_filename(validate_job(job))
+        by_name.setdefault(job.output.lower(), []).append(job)
+
+    renamed = []
+    for group in by_name.values():
+        if len(group) > 1:
+            for job in group:
+                job.output = f"{job.output}__{UNSAFE_NAME_CHARS.sub('_', Path(job.source).name)}"
+                renamed.append(job.source)
+    return renamed
+
+
+def render_job(job: Job, output_dir: str, force: bool) -> JobResult:
+    """Renderiza un reporte en el proceso del pool (o lo omite si está al día)"""
+    from pdf_service import get_photo_layout
+    from render_profiles import get_profile
+
+    started = time.perf_counter()
+    try:
+        data = validate_job(job)
+        profile = get_profile(job.profile)
+        photo_layout = get_photo_layout(job.photo_layout)
+        if not job.images:
+            raise ValueError("El reporte no tiene imágenes")
+
+        images_bytes = [Path(path).read_bytes() for path in job.images]
+        # Registro tal como viene en la entrada: sin los valores por defecto del modelo
+        digest = hashlib.sha256(_environment.encode())
+        digest.update(json.dumps(job.data, sort_keys=True, ensure_ascii=False).encode())
+        digest.update(f"{profile.name}|{photo_layout}".encode())
+        for image_bytes in images_bytes:
+            digest.update(hashlib.sha256(image_bytes).digest())
+        input_hash = digest.hexdigest()
+
+        output_path = Path(output_dir) / f"{job.output or _generator.generate_filename(data)}.pdf"
+        hash_path = output_path.with_name(output_path.name + HASH_SUFFIX)
+        if (
+            not force and output_path.exists() and hash_path.exists()
+            and hash_path.read_text().strip() == input_hash
+        ):
+            return JobResult(job.source, "skipped", str(output_path))
+
+        pdf_file, metadata = _generator.generate_site_visit_pdf(
+            data,
+            images_bytes,
+            profile=profile,
+            photo_layout=photo_layout
+        )
+        # Temporal único: otro proceso nunca escribe ni renombra el mismo archivo
+        with pdf_file, tempfile.NamedTemporaryFile(
+            dir=output_path.parent, prefix=output_path.name + ".", suffix=".tmp", delete=False
+        ) as out:
+            tmp_path = Path(out.name)
+            try:
+                while chunk := pdf_file.read(1024 * 1024):
+                    out.write(chunk)
+            except BaseException:
+                out.close()
+                tmp_path.unlink(missing_ok=True)
+                raise
+        tmp_path.replace(output_path)
+        hash_path.write_text(input_hash + "\n")
+
+        return JobResult(
+            job.source,
+            "rendered",
+            str(output_path),
+            elapsed_ms=(time.perf_counter() - started) * 1000,
+            pdf_size_bytes=metadata['pdf_size_bytes'],
+            stage_timings_ms=metadata['stage_timings_ms']
+        )
+    except Exception as e:
+        return JobResult(
+            job.source,
+            "failed",
+            elapsed_ms=(time.perf_counter() - started) * 1000,
+            error=f"{type(e).__name__}: {e}" + ("" if isinstance(e, (ValueError, OSError)) else
+                                                f"\n{traceback.format_exc(limit=3)}")
+        )
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def print_progress(done: int, total: int, counts: Dict[str, int], started: float) -> None:
+    elapsed = time.perf_counter() - started
+    rate = done / elapsed if elapsed > 0 else 0.0
+    eta = (total - done) / rate if rate > 0 else 0.0
+    sys.stderr.write(
+        f"\r[{done:>{len(str(total))}}/{total}] {rate:6.2f} reportes/s | "
+        f"ok {counts['rendered']} | omitidos {counts['skipped']} | errores {counts['failed']} | "
+        f"ETA {eta:5.0f}s "
+    )
+    sys.stderr.flush()
+
+
+def print_summary(results: List[JobResult], elapsed: float) -> None:
+    rendered = [r for r in results if r.status == "rendered"]
+    skipped = [r for r in results if r.status == "skipped"]
+    failed = [r for r in results if r.status == "failed"]
+
+    print()
+    print("=" * 72)
+    print("📊 RESUMEN")
+    print("=" * 72)
+    print(f"Reportes: {len(results)} en {elapsed:.1f}s  →  {len(results) / elapsed if elapsed else 0:.2f} reportes/s")
+    print(f"Generados: {len(rendered)}   Omitidos (al día): {len(skipped)}   Errores: {len(failed)}")
+
+    if rendered:
+        latencies = [r.elapsed_ms for r in rendered]
+        print(f"Tiempo por reporte: p50={percentile(latencies, 50):.0f}  p95={percentile(latencies, 95):.0f}  "
+              f"max={max(latencies):.0f} ms")
+        print(f"Tamaño total: {sum(r.pdf_size_bytes for r in rendered) / (1024 * 1024):.1f} MB")
+        stages: Dict[str, List[float]] = {}
+        for r in rendered:
+            for stage, ms in r.stage_timings_ms.items():
+                stages.setdefault(stage, []).append(ms)
+        print("Etapas (promedio):  " + "  ".join(
+            f"{stage}={sum(v) / len(v):.0f}ms" for stage, v in stages.items()
+        ))
+
+    if failed:
+        print("\n❌ Errores:")
+        for r in failed:
+            print(f"  {r.source}: {r.error}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Render por lotes de reportes de visita")
+    parser.add_argument('input', type=Path, help="Manifiesto JSONL o directorio de reportes")
+    parser.add_argument('--output', type=Path, required=True, help="Directorio de salida de los PDFs")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Procesos del pool")
+    parser.add_argument('--profile', help="Perfil para los reportes que no indican uno")
+    parser.add_argument('--photo-layout', help="Distribución de fotos para los que no indican una")
+    parser.add_argument('--force', action='store_true', help="Renderizar aunque el PDF esté al día")
+    return parser
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    jobs = load_jobs(args.input)
+    if not jobs:
+        print("❌ No se encontraron reportes")
+        return 1
+    from pdf_service import PDFGenerator
+
+    results: List[JobResult] = []
+    counts = {"rendered": 0, "skipped": 0, "failed": 0}
+    valid_jobs = []
+    for job in jobs:
+        job.profile = job.profile or args.profile
+        job.photo_layout = job.photo_layout or args.photo_layout
+        try:
+            validate_job(job)
+        except ValueError as e:
+            # ValidationError de pydantic también es ValueError
+            results.append(JobResult(job.source, "failed", error=f"{type(e).__name__}: {e}"))
+            counts["failed"] += 1
+            continue
+        valid_jobs.append(job)
+    renamed = assign_outputs(valid_jobs, PDFGenerator())
+    if renamed:
+        print(f"⚠️  {len(renamed)} reportes con el mismo nombre de salida; se agrega su origen: "
+              + ", ".join(renamed))
+    args.output.mkdir(parents=True, exist_ok=True)
+
+    workers = max(1, min(args.workers, len(valid_jobs) or 1))
+    print(f"🚀 {len(jobs)} reportes con {workers} procesos → {args.output}")
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(_environment_digest(),)
+    ) as pool:
+        futures = [pool.submit(render_job, job, str(args.output), args.force) for job in valid_jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            counts[result.status] += 1
+            print_progress(len(results), len(jobs), counts, started)
+
+    print_summary(results, time.perf_counter() - started)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
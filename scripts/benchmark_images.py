@@ -0,0 +1,196 @@
+"""
+Benchmark de optimize_image para imágenes con transparencia, paleta y grises
+
+Compara la ruta actual (redimensionar con alpha premultiplicado y aplanar al
+tamaño final) contra la anterior (fondo blanco y composición a resolución
+completa, luego redimensionar) en capturas de pantalla RGBA, planos PNG con
+paleta y escaneos en grises. Cada medición corre en un proceso nuevo para
+que el pico de RSS sea comparable.
+
+Uso:
+    python scripts/benchmark_images.py
+    python scripts/benchmark_images.py --repeat 5 --scale 0.5
+"""
+import argparse
+import io
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageOps
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_processor import ImageProcessor  # noqa: E402
+
+
+def legacy_optimize(image_bytes: bytes, max_width: int = 800, quality: int = 85) -> bytes:
+    """Ruta anterior: fondo blanco y composición a tamaño completo, luego redimensionar"""
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        if img.mode == 'RGBA':
+            background.paste(img, mask=img.split()[-1])
+        else:
+            background.paste(img)
+        img = background
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if img.width > max_width:
+        img = img.resize((max_width, int(img.height * max_width / img.width)), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def current_optimize(image_bytes: bytes) -> bytes:
+    return ImageProcessor.optimize_image(image_bytes, max_width=800, quality=85)[0]
+
+
+def _png(img: Image.Image, **params) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', compress_level=1, **params)
+    return buffer.getvalue()
+
+
+def _draw_screenshot(scale: float) -> Image.Image:
+    size = (int(3840 * scale), int(2160 * scale))
+    img = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for i in range(40):
+        x, y = (i * 97) % size[0], (i * 53) % size[1]
+        draw.rectangle((x, y, x + size[0] // 4, y + size[1] // 5), fill=(30 + i * 5, 90, 200 - i * 3, 80 + i * 4))
+    for y in range(0, size[1], 24):
+        draw.line((0, y, size[0], y), fill=(20, 20, 20, 255), width=2)
+    return img
+
+
+def make_screenshot(scale: float) -> bytes:
+    """Captura RGBA con ventanas semitransparentes y fondo transparente"""
+    return _png(_draw_screenshot(scale))
+
+
+def make_opaque_screenshot(scale: float) -> bytes:
+    """Captura RGBA con alpha totalmente opaco (el caso más común)"""
+    img = _draw_screenshot(scale)
+    return _png(Image.alpha_composite(Image.new('RGBA', img.size, (240, 240, 240, 255)), img))
+
+
+def make_palette_plan(scale: float) -> bytes:
+    """Plano con paleta de 16 colores y fondo transparente (tRNS)"""
+    size = (int(9000 * scale), int(6000 * scale))
+    img = Image.new('P', size, 0)
+    img.putpalette([255, 255, 255] + [(i * 37) % 256 for i in range(45)])
+    draw = ImageDraw.Draw(img)
+    for i in range(0, size[0], 40):
+        draw.line((i, 0, i, size[1]), fill=1 + (i // 40) % 14, width=3)
+    for j in range(0, size[1], 55):
+        draw.line((0, j, size[0], j), fill=2 + (j // 55) % 13, width=2)
+    return _png(img, transparency=0)
+
+
+def make_gray_alpha_scan(scale: float) -> bytes:
+    """Escaneo en grises con máscara alpha (LA)"""
+    size = (int(6000 * scale), int(4500 * scale))
+    rng = np.random.default_rng(0)
+    luminance = rng.integers(180, 255, size=(size[1], size[0]), dtype=np.uint8)
+    alpha = np.full((size[1], size[0]), 255, dtype=np.uint8)
+    alpha[:, : size[0] // 6] = 0
+    img = Image.merge('LA', (Image.fromarray(luminance, 'L'), Image.fromarray(alpha, 'L')))
+    return _png(img)
+
+
+CASES = {
+    'captura RGBA': make_screenshot,
+    'captura opaca': make_opaque_screenshot,
+    'plano P+tRNS': make_palette_plan,
+    'escaneo LA': make_gray_alpha_scan,
+}
+VARIANTS = {'anterior': legacy_optimize, 'actual': current_optimize}
+
+
+def _peak_rss_kb() -> int:
+    """Pico de RSS del proceso (VmHWM en Linux, si no ru_maxrss)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _reset_peak_rss() -> None:
+    """
+    Reinicia el pico de RSS (Linux >= 4.0)
+
+    ru_maxrss se hereda del proceso padre a través de fork/exec, así que sin
+    reiniciarlo el pico base incluiría la memoria del proceso que genera los casos.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _measure(variant: str, image_path: str, repeat: int, queue) -> None:
+    fn = VARIANTS[variant]
+    # La imagen se lee de disco: pasarla como argumento (pickle) sube el pico base
+    image_bytes = Path(image_path).read_bytes()
+    _reset_peak_rss()
+    baseline_kb = _peak_rss_kb()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(image_bytes)
+        timings.append((time.perf_counter() - started) * 1000)
+    peak_kb = _peak_rss_kb()
+    queue.put((min(timings), (peak_kb - baseline_kb) / 1024, result))
+
+
+def run_isolated(variant: str, image_path: str, repeat: int):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(variant, image_path, repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def mean_abs_diff(a: bytes, b: bytes) -> float:
+    img_a = np.asarray(Image.open(io.BytesIO(a)).convert('RGB'), dtype=np.int16)
+    img_b = np.asarray(Image.open(io.BytesIO(b)).convert('RGB'), dtype=np.int16)
+    return float(np.abs(img_a - img_b).mean())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de conversión de modo y alpha")
+    parser.add_argument('--repeat', type=int, default=3, help="Repeticiones por caso (se toma la mejor)")
+    parser.add_argument('--scale', type=float, default=1.0, help="Escala de las imágenes sintéticas")
+    args = parser.parse_args()
+
+    print(f"{'caso':<14} {'resolución':>11} {'variante':<9} {'ms':>8} {'pico RSS MB':>12}")
+    for name, make in CASES.items():
+        image_bytes = make(args.scale)
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            resolution = f"{img.width}x{img.height}"
+        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
+            tmp.write(image_bytes)
+        del image_bytes
+        outputs = {}
+        try:
+            for variant in VARIANTS:
+                best_ms, peak_mb, outputs[variant] = run_isolated(variant, tmp.name, args.repeat)
+                print(f"{name:<14} {resolution:>11} {variant:<9} {best_ms:>8.0f} {peak_mb:>12.1f}")
+        finally:
+            Path(tmp.name).unlink()
+        print(f"{'':<14} {'':>11} diferencia media por canal: {mean_abs_diff(*outputs.values()):.2f}/255")
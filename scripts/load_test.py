@@ -0,0 +1,300 @@
+"""
+Generador de carga para el servicio de PDFs
+
+Envía reportes concurrentes a /api/reports/site-visit, ya sea contra la app
+en proceso (transporte ASGI, sin levantar servidor) o contra una URL, y
+reporta throughput, percentiles de latencia, tasas de error y de 429, y los
+tiempos por etapa del servidor (header Server-Timing) a lo largo del tiempo.
+
+Uso:
+    python scripts/load_test.py                               # app en proceso
+    python scripts/load_test.py --url http://localhost:8000 --concurrency 16 --duration 60
+    python scripts/load_test.py --photos 1,6,12 --class-mix interactive=3,bulk=1 \\
+        --profile-mix final=1,draft=1 --json resultados.json
+
+Cada petición lleva un numero_visita distinto para que el servicio no las
+coalesca en un mismo render; --allow-coalescing envía datos idénticos.
+
+Requiere httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from PIL import Image
+
+SAMPLE_DATA = {
+    "nombre_planta": "Planta Solar - Prueba de carga",
+    "id_proyecto": "LOAD001",
+    "ubicacion": "Querétaro, México",
+    "persona_responsable_interna": "Equipo de Pruebas",
+    "responsable_obra": "Equipo de Pruebas",
+    "numero_visita": 1,
+    "hora_entrada": "09:00",
+    "hora_salida": "11:30",
+    "motivo_visita": "Prueba de carga del servicio de generación de PDFs",
+    "avances_conforme_cronograma": True,
+    "razon_no_conforme": "",
+    "acuerdos": "Medir throughput y latencia",
+    "lugar_elaboracion": "Querétaro, Qro."
+}
+
+
+@dataclass
+class RequestResult:
+    """Resultado de una petición individual"""
+    started_at: float  # Segundos desde el inicio de la prueba
+    latency_ms: float
+    status: int
+    priority_class: str
+    profile: str
+    photos: int
+    response_bytes: int = 0
+    coalesced: bool = False  # Respondida con el render en curso de otra petición
+    server_timing: Dict[str, float] = field(default_factory=dict)
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Convierte 'a=3,b=1' en {'a': 3.0, 'b': 1.0}"""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Convierte 'images;dur=12.3, layout;dur=45.6' en {'images': 12.3, 'layout': 45.6}"""
+    timings = {}
+    if not header:
+        return timings
+    for entry in header.split(','):
+        name, *params = [p.strip() for p in entry.split(';')]
+        for param in params:
+            if param.startswith('dur='):
+                timings[name] = float(param[4:])
+    return timings
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def create_photo(width: int, height: int, seed: int) -> bytes:
+    """Foto sintética con ruido de color (no se comprime trivialmente como un color plano)"""
+    rng = random.Random(seed)
+    channels = [Image.effect_noise((width, height), rng.randint(20, 80)) for _ in range(3)]
+    img = Image.merge('RGB', channels)
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def weighted_choice(rng: random.Random, mix: Dict[str, float]) -> str:
+    return rng.choices(list(mix), weights=list(mix.values()))[0]
+
+
+async def run_load(args, client: httpx.AsyncClient) -> Tuple[List[RequestResult], float]:
+    width, height = (int(v) for v in args.photo_size.lower().split('x'))
+    photo_sizes = [int(n) for n in args.photos.split(',')]
+    class_mix = parse_mix(args.class_mix)
+    profile_mix = parse_mix(args.profile_mix)
+    rng = random.Random(args.seed)
+
+    print(f"🖼️  Generando fotos de {width}x{height}...")
+    pool = [create_photo(width, height, seed) for seed in range(min(max(photo_sizes), 8))]
+
+    results: List[RequestResult] = []
+    issued = 0
+    test_start = time.perf_counter()
+    deadline = test_start + args.duration if args.duration else None
+
+    def next_slot() -> Optional[int]:
+        """Número de la siguiente petición, o None si la prueba terminó"""
+        nonlocal issued
+        if deadline is not None and time.perf_counter() >= deadline:
+            return None
+        if deadline is None and issued >= args.requests:
+            return None
+        issued += 1
+        return issued
+
+    async def worker(worker_id: int):
+        while (sequence := next_slot()) is not None:
+            # Datos distintos por petición: con datos idénticos las peticiones
+            # simultáneas se suman a un mismo render y se mediría menos trabajo
+            report_data = SAMPLE_DATA if args.allow_coalescing else {**SAMPLE_DATA, 'numero_visita': sequence}
+            photos = rng.choice(photo_sizes)
+            priority_class = weighted_choice(rng, class_mix)
+            profile = weighted_choice(rng, profile_mix)
+            files = [
+                ('images', (f'foto_{i + 1}.jpg', pool[i % len(pool)], 'image/jpeg'))
+                for i in range(photos)
+            ]
+            headers = {
+                'X-Priority-Class': priority_class,
+                'X-API-Key': f'{args.client_prefix}-{priority_class}-{worker_id % args.clients}'
+            }
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    '/api/reports/site-visit',
+                    data={'data': json.dumps(report_data), 'profile': profile},
+                    files=files,
+                    headers=headers
+                )
+                status = response.status_code
+                size = len(response.content)
+                coalesced = response.headers.get('X-Render-Coalesced') == 'true'
+                server_timing = parse_server_timing(response.headers.get('Server-Timing'))
+            except httpx.HTTPError:
+                status, size, coalesced, server_timing = 0, 0, False, {}
+            results.append(RequestResult(
+                started_at=started - test_start,
+                latency_ms=(time.perf_counter() - started) * 1000,
+                status=status,
+                priority_class=priority_class,
+                profile=profile,
+                photos=photos,
+                response_bytes=size,
+                coalesced=coalesced,
+                server_timing=server_timing
+            ))
+
+    print(f"🚀 {args.concurrency} workers concurrentes...")
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    return results, time.perf_counter() - test_start
+
+
+def latency_summary(results: List[RequestResult]) -> str:
+    latencies = [r.latency_ms for r in results]
+    return (
+        f"p50={percentile(latencies, 50):8.1f}  p95={percentile(latencies, 95):8.1f}  "
+        f"p99={percentile(latencies, 99):8.1f}  max={max(latencies, default=0):8.1f} ms"
+    )
+
+
+def stage_summary(results: List[RequestResult]) -> Dict[str, float]:
+    per_stage = defaultdict(list)
+    for r in results:
+        for stage, ms in r.server_timing.items():
+            per_stage[stage].append(ms)
+    return {stage: sum(v) / len(v) for stage, v in per_stage.items()}
+
+
+def print_report(results: List[RequestResult], elapsed: float, interval: float) -> None:
+    total = len(results)
+    if not total:
+        print("❌ No se completó ninguna petición")
+        return
+    ok = [r for r in results if 200 <= r.status < 300]
+    throttled = [r for r in results if r.status == 429]
+    errors = [r for r in results if not (200 <= r.status < 300) and r.status != 429]
+
+    print()
+    print("=" * 72)
+    print("📊 RESUMEN")
+    print("=" * 72)
+    print(f"Peticiones: {total} en {elapsed:.1f}s  →  {total / elapsed:.2f} req/s "
+          f"({len(ok) / elapsed:.2f} exitosas/s)")
+    print(f"Errores: {len(errors) / total:.1%}   429: {len(throttled) / total:.1%}   "
+          f"Coalescidas: {sum(1 for r in ok if r.coalesced)}")
+    print(f"Latencia (exitosas): {latency_summary(ok)}")
+
+    print("\nPor clase de prioridad:")
+    for priority_class in sorted({r.priority_class for r in results}):
+        subset = [r for r in ok if r.priority_class == priority_class]
+        print(f"  {priority_class:<12} n={len(subset):<5} {latency_summary(subset)}")
+
+    print("\nPor cantidad de fotos:")
+    for photos in sorted({r.photos for r in results}):
+        subset = [r for r in ok if r.photos == photos]
+        print(f"  {photos:>3} fotos    n={len(subset):<5} {latency_summary(subset)}")
+
+    stages = stage_summary(ok)
+    if stages:
+        print("\nEtapas del servidor (promedio, Server-Timing):")
+        for stage, mean_ms in stages.items():
+            print(f"  {stage:<10} {mean_ms:8.1f} ms")
+
+    print(f"\nEvolución (ventanas de {interval:g}s):")
+    stage_names = list(stages)
+    print(f"  {'t':>6} {'req/s':>7} {'p95 ms':>9} {'429':>5} {'err':>5}  "
+          + " ".join(f"{name:>9}" for name in stage_names))
+    buckets = defaultdict(list)
+    for r in results:
+        buckets[int(r.started_at // interval)].append(r)
+    for bucket in sorted(buckets):
+        window = buckets[bucket]
+        window_ok = [r for r in window if 200 <= r.status < 300]
+        window_stages = stage_summary(window_ok)
+        print(
+            f"  {bucket * interval:>5.0f}s {len(window) / interval:>7.2f} "
+            f"{percentile([r.latency_ms for r in window_ok], 95):>9.1f} "
+            f"{sum(1 for r in window if r.status == 429):>5} "
+            f"{sum(1 for r in window if r.status != 429 and not 200 <= r.status < 300):>5}  "
+            + " ".join(f"{window_stages.get(name, 0):>9.1f}" for name in stage_names)
+        )
+
+
+async def main_async(args) -> Tuple[List[RequestResult], float]:
+    timeout = httpx.Timeout(args.timeout)
+    if args.url:
+        print(f"📡 Destino: {args.url}")
+        client = httpx.AsyncClient(base_url=args.url, timeout=timeout)
+    else:
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+        import main
+        print("📡 Destino: app en proceso (ASGI)")
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app),
+            base_url="http://loadtest",
+            timeout=timeout
+        )
+    async with client:
+        return await run_load(args, client)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Prueba de carga del servicio de PDFs")
+    parser.add_argument('--url', help="URL del servicio (default: app en proceso)")
+    parser.add_argument('--concurrency', type=int, default=4, help="Peticiones simultáneas")
+    parser.add_argument('--requests', type=int, default=40, help="Total de peticiones")
+    parser.add_argument('--duration', type=float, help="Duración en segundos (ignora --requests)")
+    parser.add_argument('--photos', default='1,6,12', help="Tamaños de set de fotos a sortear")
+    parser.add_argument('--photo-size', default='1600x1200', help="Resolución de cada foto")
+    parser.add_argument('--class-mix', default='interactive=1',
+                        help="Mezcla de clases de prioridad, ej. interactive=3,bulk=1")
+    parser.add_argument('--profile-mix', default='final=1', help="Mezcla de perfiles, ej. final=1,draft=1")
+    parser.add_argument('--clients', type=int, default=2, help="API keys distintas por clase")
+    parser.add_argument('--client-prefix', default='load', help="Prefijo de las API keys")
+    parser.add_argument('--interval', type=float, default=5.0, help="Ventana del reporte temporal (s)")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Timeout por petición (s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--allow-coalescing', action='store_true',
+                        help="Enviar datos idénticos (las peticiones simultáneas comparten render)")
+    parser.add_argument('--json', help="Guardar resultados crudos en este archivo")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    results, elapsed = asyncio.run(main_async(args))
+    print_report(results, elapsed, args.interval)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+        print(f"\n💾 Resultados guardados en {args.json}")
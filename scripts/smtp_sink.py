@@ -0,0 +1,85 @@
+"""
+Servidor SMTP local para probar el envío de PDFs por email
+
+Acepta todos los mensajes, imprime un resumen y los guarda como .eml. Puede
+simular fallas temporales (451) para probar los reintentos de la cola.
+
+Uso:
+    python scripts/smtp_sink.py                         # localhost:1025, guarda en smtp_sink/
+    python scripts/smtp_sink.py --port 2525 --fail-first 2
+
+Y en el servicio (.env):
+    DELIVERY_ENABLED=true
+    SMTP_HOST=localhost
+    SMTP_PORT=1025
+    SMTP_STARTTLS=false
+
+Requiere aiosmtpd (pip install aiosmtpd).
+"""
+import argparse
+import time
+from email import message_from_bytes
+from pathlib import Path
+
+from aiosmtpd.controller import Controller
+
+
+class SinkHandler:
+    """Handler de aiosmtpd que guarda cada mensaje recibido"""
+
+    def __init__(self, output_dir: Path, fail_first: int = 0, reject: bool = False):
+        self.output_dir = output_dir
+        self.fail_remaining = fail_first
+        self.reject = reject
+        self.received = 0
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.reject:
+            return "550 Buzón no disponible (simulado)"
+        if self.fail_remaining > 0:
+            self.fail_remaining -= 1
+            return "451 Falla temporal (simulada)"
+
+        self.received += 1
+        self.sessions.add(id(session))
+        message = message_from_bytes(envelope.content)
+        attachments = [
+            f"{part.get_filename()} ({len(part.get_payload(decode=True)) / 1024:.1f} KB)"
+            for part in message.walk()
+            if part.get_filename()
+        ]
+        path = self.output_dir / f"{int(time.time() * 1000)}_{self.received}.eml"
+        path.write_bytes(envelope.content)
+        print(
+            f"📨 #{self.received} (conexión {len(self.sessions)}) {envelope.mail_from} → "
+            f"{', '.join(envelope.rcpt_tos)} | {message['Subject']} | {', '.join(attachments) or 'sin adjuntos'}"
+        )
+        return "250 Mensaje aceptado"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor SMTP local de prueba")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--output', default='smtp_sink', help="Directorio donde guardar los .eml")
+    parser.add_argument('--fail-first', type=int, default=0, help="Responder 451 a los primeros N mensajes")
+    parser.add_argument('--reject', action='store_true', help="Responder 550 a todos los mensajes")
+    args = parser.parse_args()
+
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    controller = Controller(
+        SinkHandler(output_dir, fail_first=args.fail_first, reject=args.reject),
+        hostname=args.host,
+        port=args.port
+    )
+    controller.start()
+    print(f"📡 SMTP de prueba en {args.host}:{args.port} (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        controller.stop()
@@ -0,0 +1,323 @@
+// Lógica para mostrar/ocultar razón de no conformidad
+function toggleReason(show) {
+    const container = document.getElementById('razonContainer');
+    const input = container.querySelector('input');
+    if (show) {
+        container.style.display = 'block';
+        input.setAttribute('required', 'true');
+    } else {
+        container.style.display = 'none';
+        input.removeAttribute('required');
+        input.value = '';
+    }
+}
+
+// Configurar fecha por defecto a hoy
+document.querySelector('input[name="fecha"]').valueAsDate = new Date();
+
+// Lógica de Imágenes
+const dropZone = document.getElementById('dropZone');
+const fileInput = document.getElementById('fileInput');
+const cameraInput = document.getElementById('cameraInput');
+const galleryInput = document.getElementById('galleryInput');
+const btnCamera = document.getElementById('btnCamera');
+const btnGallery = document.getElementById('btnGallery');
+const previewContainer = document.getElementById('preview-container');
+const deleteAllBtn = document.getElementById('deleteAllBtn');
+const sizeInfo = document.getElementById('sizeInfo');
+
+let selectedFiles = []; // Array de objetos { file: File, compressed: Blob|null, url: string }
+const MAX_TOTAL_SIZE_MB = 30;
+const PREVIEW_WAIT_MS = 3000; // Espera máxima de la vista previa antes de pedir el PDF
+
+dropZone.addEventListener('click', () => fileInput.click());
+
+// Botón de cámara: abre la cámara del dispositivo
+btnCamera.addEventListener('click', () => cameraInput.click());
+cameraInput.addEventListener('change', (e) => {
+    handleFiles(e.target.files);
+    cameraInput.value = '';
+});
+
+// Botón de galería: abre el selector de archivos
+btnGallery.addEventListener('click', () => galleryInput.click());
+galleryInput.addEventListener('change', (e) => {
+    handleFiles(e.target.files);
+    galleryInput.value = '';
+});
+
+dropZone.addEventListener('dragover', (e) => {
+    e.preventDefault();
+    dropZone.classList.add('dragover');
+});
+
+dropZone.addEventListener('dragleave', () => {
+    dropZone.classList.remove('dragover');
+});
+
+dropZone.addEventListener('drop', (e) => {
+    e.preventDefault();
+    dropZone.classList.remove('dragover');
+    handleFiles(e.dataTransfer.files);
+});
+
+fileInput.addEventListener('change', (e) => {
+    handleFiles(e.target.files);
+    fileInput.value = ''; // Reset para permitir seleccionar los mismos archivos
+});
+
+async function handleFiles(files) {
+    const newFiles = Array.from(files).filter(file => file.type.startsWith('image/'));
+
+    // Procesar y comprimir imágenes nuevas
+    const processed = await Promise.all(newFiles.map(async (file) => {
+        try {
+            return await processImage(file);
+        } catch (e) {
+            console.error("Error procesando imagen", e);
+            return null;
+        }
+    }));
+
+    const validProcessed = processed.filter(p => p !== null);
+    selectedFiles = [...selectedFiles, ...validProcessed];
+    updatePreview();
+}
+
+async function processImage(file) {
+    // Si la imagen es mayor a 1MB, intentamos comprimirla
+    if (file.size > 1 * 1024 * 1024) {
+        return await compressImage(file);
+    } else {
+        return {
+            file: file,
+            compressed: null, // No comprimida (original usada)
+            size: file.size,
+            url: URL.createObjectURL(file)
+        };
+    }
+}
+
+function compressImage(file) {
+    return new Promise((resolve, reject) => {
+        const reader = new FileReader();
+        reader.readAsDataURL(file);
+        reader.onload = (event) => {
+            const img = new Image();
+            img.src = event.target.result;
+            img.onload = () => {
+                const canvas = document.createElement('canvas');
+                const MAX_WIDTH = 1920;
+                const MAX_HEIGHT = 1920;
+                let width = img.width;
+                let height = img.height;
+
+                if (width > height) {
+                    if (width > MAX_WIDTH) {
+                        height *= MAX_WIDTH / width;
+                        width = MAX_WIDTH;
+                    }
+                } else {
+                    if (height > MAX_HEIGHT) {
+                        width *= MAX_HEIGHT / height;
+                        height = MAX_HEIGHT;
+                    }
+                }
+
+                canvas.width = width;
+                canvas.height = height;
+                const ctx = canvas.getContext('2d');
+                ctx.drawImage(img, 0, 0, width, height);
+
+                canvas.toBlob((blob) => {
+                    if (!blob) {
+                        reject(new Error('Compression failed'));
+                        return;
+                    }
+                    // Si el blob comprimido es mayor que el original, usamos el original
+                    if (blob.size >= file.size) {
+                        resolve({
+                            file: file,
+                            compressed: null,
+                            size: file.size,
+                            url: URL.createObjectURL(file)
+                        });
+                    } else {
+                        resolve({
+                            file: file, // Guardamos referencia al original por si acaso
+                            compressed: blob, // Usaremos este para enviar
+                            size: blob.size,
+                            url: URL.createObjectURL(blob)
+                        });
+                    }
+                }, 'image/jpeg', 0.8); // Calidad Jpeg 0.8
+            };
+            img.onerror = (err) => reject(err);
+        };
+        reader.onerror = (err) => reject(err);
+    });
+}
+
+function updatePreview() {
+    previewContainer.innerHTML = '';
+    let totalSize = 0;
+
+    selectedFiles.forEach((item, index) => {
+        totalSize += item.size;
+        const div = document.createElement('div');
+        div.className = 'preview-item';
+        div.innerHTML = `
+            <div class="delete-btn" onclick="removeFile(${index})" title="Eliminar">&times;</div>
+            <img src="${item.url}" title="${item.file.name} (${(item.size / 1024 / 1024).toFixed(2)} MB)">
+        `;
+        previewContainer.appendChild(div);
+    });
+
+    // Actualizar info de tamaño
+    const totalMB = totalSize / (1024 * 1024);
+    sizeInfo.innerText = `Total: ${totalMB.toFixed(2)} MB / ${MAX_TOTAL_SIZE_MB} MB`;
+
+    if (totalMB > MAX_TOTAL_SIZE_MB) {
+        sizeInfo.classList.add('error');
+    } else {
+        sizeInfo.classList.remove('error');
+    }
+
+    // Mostrar/ocultar botón de borrar todo
+    deleteAllBtn.style.display = selectedFiles.length > 0 ? 'block' : 'none';
+}
+
+function removeFile(index) {
+    selectedFiles.splice(index, 1);
+    updatePreview();
+}
+
+function removeAllFiles() {
+    if (confirm('¿Seguro que quieres eliminar todas las imágenes?')) {
+        selectedFiles = [];
+        updatePreview();
+    }
+}
+
+// Envío del Formulario
+document.getElementById('reportForm').addEventListener('submit', async (e) => {
+    e.preventDefault();
+
+    if (selectedFiles.length === 0) {
+        alert('Por favor agrega al menos una imagen de evidencia.');
+        return;
+    }
+
+    // Validar peso total
+    let totalSize = selectedFiles.reduce((acc, item) => acc + item.size, 0);
+    if (totalSize > MAX_TOTAL_SIZE_MB * 1024 * 1024) {
+        alert(`El peso total de las imágenes (${(totalSize / 1024 / 1024).toFixed(2)} MB) excede el límite de ${MAX_TOTAL_SIZE_MB} MB. Por favor elimina algunas imágenes.`);
+        return;
+    }
+
+    const formData = new FormData(e.target);
+
+    // Construir objeto JSON para el campo 'data'
+    const jsonData = {};
+    formData.forEach((value, key) => {
+        if (key !== 'images' && key !== 'razon_no_conforme' && key !== 'profile' && key !== 'photo_layout') {
+            jsonData[key] = value;
+        }
+    });
+
+    // Manejo especial de booleanos y condicionales
+    jsonData['avances_conforme_cronograma'] = formData.get('avances_conforme_cronograma') === 'true';
+    if (!jsonData['avances_conforme_cronograma']) {
+        jsonData['razon_no_conforme'] = formData.get('razon_no_conforme');
+    } else {
+        jsonData['razon_no_conforme'] = "";
+    }
+
+    // Convertir formato de fecha
+    if (jsonData['fecha']) {
+        const parts = jsonData['fecha'].split('-');
+        jsonData['fecha'] = `${parts[2]}/${parts[1]}/${parts[0]}`;
+    }
+
+    // Crear FormData final para enviar
+    const finalFormData = new FormData();
+    finalFormData.append('data', JSON.stringify(jsonData));
+    finalFormData.append('profile', formData.get('profile') || 'final');
+    finalFormData.append('photo_layout', formData.get('photo_layout') || 'grid');
+
+    // Adjuntar imágenes (usando la versión comprimida si existe)
+    selectedFiles.forEach((item, index) => {
+        const blobToSend = item.compressed || item.file;
+        // Nos aseguramos de enviar un nombre de archivo
+        finalFormData.append('images', blobToSend, item.file.name);
+    });
+
+    const btn = document.querySelector('.btn-submit');
+    btn.disabled = true;
+    document.getElementById('loadingOverlay').style.display = 'flex';
+
+    // La vista previa (solo datos, sin fotos) se pide primero y el PDF cuando
+    // responde: ocupan un slot de render a la vez y el PDF reutiliza el resumen
+    // que la vista previa dejó maquetado en la caché del servidor
+    const previewImage = document.getElementById('previewImage');
+    let pdfFinished = false;
+    const previewFormData = new FormData();
+    previewFormData.append('data', JSON.stringify(jsonData));
+    const previewRequest = fetch('/api/reports/site-visit/preview.png', {
+        method: 'POST',
+        body: previewFormData
+    }).then(async (previewResponse) => {
+        if (!previewResponse.ok) return;
+        const previewBlob = await previewResponse.blob();
+        if (pdfFinished) return;
+        previewImage.src = URL.createObjectURL(previewBlob);
+        previewImage.style.display = 'block';
+    }).catch((error) => {
+        console.warn('Vista previa no disponible', error);
+    });
+    // Si la vista previa tarda, el PDF no la espera más de PREVIEW_WAIT_MS
+    await Promise.race([
+        previewRequest,
+        new Promise((resolve) => setTimeout(resolve, PREVIEW_WAIT_MS))
+    ]);
+    const pdfRequest = fetch('/api/reports/site-visit', {
+        method: 'POST',
+        body: finalFormData
+    });
+
+    try {
+        const response = await pdfRequest;
+
+        if (response.ok) {
+            const blob = await response.blob();
+            const url = window.URL.createObjectURL(blob);
+            const a = document.createElement('a');
+            a.href = url;
+            const contentDisposition = response.headers.get('Content-Disposition');
+            let filename = 'reporte_visita.pdf';
+            if (contentDisposition) {
+                const filenameMatch = contentDisposition.match(/filename="(.+)"/);
+                if (filenameMatch && filenameMatch.length === 2) filename = filenameMatch[1];
+            }
+            a.download = filename;
+            document.body.appendChild(a);
+            a.click();
+            a.remove();
+        } else {
+            const errorData = await response.json();
+            alert('Error: ' + (errorData.detail || 'Error al generar PDF'));
+        }
+    } catch (error) {
+        console.error(error);
+        alert('Error de conexión con el servidor');
+    } finally {
+        pdfFinished = true;
+        btn.disabled = false;
+        document.getElementById('loadingOverlay').style.display = 'none';
+        if (previewImage.src) {
+            URL.revokeObjectURL(previewImage.src);
+            previewImage.removeAttribute('src');
+            previewImage.style.display = 'none';
+        }
+    }
+});
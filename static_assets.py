@@ -0,0 +1,149 @@
+"""
+Recursos estáticos pre-renderizados y precomprimidos
+
+El formulario y sus CSS/JS se preparan una sola vez al iniciar la app: el
+HTML se renderiza con Jinja, cada recurso se comprime de antemano con gzip
+y brotli y recibe un ETag fuerte. Los CSS/JS se publican con la huella de su
+contenido en la URL (form.<hash>.css) para poder cachearlos como inmutables;
+el HTML se revalida con If-None-Match y responde 304 si no cambió.
+"""
+import gzip
+import hashlib
+import mimetypes
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se ofrece gzip
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MIN_COMPRESS_BYTES = 512  # Recursos más pequeños se sirven sin comprimir
+FINGERPRINT_LENGTH = 12
+
+
+@dataclass
+class StaticAsset:
+    """Recurso en memoria con sus variantes comprimidas"""
+    content: bytes
+    media_type: str
+    cache_control: str
+    etag: str = ""
+    encoded: Dict[str, bytes] = field(default_factory=dict)  # Content-Encoding -> cuerpo
+
+    def __post_init__(self):
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.etag = f'"{digest[:32]}"'
+        if len(self.content) >= MIN_COMPRESS_BYTES:
+            if brotli is not None:
+                self.encoded['br'] = brotli.compress(self.content, quality=11)
+            self.encoded['gzip'] = gzip.compress(self.content, compresslevel=9, mtime=0)
+
+    @property
+    def fingerprint(self) -> str:
+        return self.etag.strip('"')[:FINGERPRINT_LENGTH]
+
+    def _variant_etag(self, encoding: Optional[str]) -> str:
+        # ETag fuerte distinto por codificación (cada variante es otra representación)
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+    def _negotiate(self, accept_encoding: str) -> Optional[str]:
+        accepted = {}
+        for item in accept_encoding.lower().split(','):
+            name, _, params = item.strip().partition(';')
+            quality = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    continue
+            accepted[name.strip()] = quality
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encoded and accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+    def respond(self, request: Request) -> Response:
+        """
+        Responde con la mejor variante para el cliente o 304 si ya la tiene
+
+        Args:
+            request: Petición entrante (Accept-Encoding, If-None-Match)
+
+        Returns:
+            Response con cuerpo, o 304 sin cuerpo
+        """
+        encoding = self._negotiate(request.headers.get('accept-encoding', ''))
+        headers = {
+            'ETag': self._variant_etag(encoding),
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding'
+        }
+
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match:
+            # Cualquier variante del mismo contenido vale (comparación débil, RFC 9110)
+            known = {self._variant_etag(name) for name in (None, *self.encoded)}
+            candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            if '*' in candidates or known & candidates:
+                return Response(status_code=304, headers=headers)
+
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+            return Response(self.encoded[encoding], media_type=self.media_type, headers=headers)
+        return Response(self.content, media_type=self.media_type, headers=headers)
+
+
+class StaticAssetRegistry:
+    """Recursos del formulario publicados con URL con huella de contenido"""
+
+    def __init__(self, directory: Path, url_prefix: str = "/static"):
+        """
+        Carga y precomprime todos los archivos del directorio
+
+        Args:
+            directory: Directorio con los CSS/JS
+            url_prefix: Ruta bajo la que se montan
+        """
+        self.url_prefix = url_prefix.rstrip('/')
+        self._by_name: Dict[str, StaticAsset] = {}
+        self._by_url_name: Dict[str, StaticAsset] = {}
+        for path in sorted(Path(directory).iterdir()):
+            if not path.is_file():
+                continue
+            media_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+            if media_type == 'application/javascript':
+                # Starlette solo agrega el charset a los tipos text/*
+                media_type = f"{media_type}; charset=utf-8"
+            asset = StaticAsset(path.read_bytes(), media_type, IMMUTABLE_CACHE_CONTROL)
+            self._by_name[path.name] = asset
+            self._by_url_name[f"{path.stem}.{asset.fingerprint}{path.suffix}"] = asset
+
+    def url_for(self, name: str) -> str:
+        """URL con huella de contenido de un recurso (KeyError si no existe)"""
+        path = Path(name)
+        asset = self._by_name[name]
+        return f"{self.url_prefix}/{path.stem}.{asset.fingerprint}{path.suffix}"
+
+    def get(self, url_name: str) -> Optional[StaticAsset]:
+        """Recurso por nombre con huella (None si no existe o la huella es vieja)"""
+        return self._by_url_name.get(url_name)
+
+    def render_page(self, render: Callable[..., str], cache_control: str) -> StaticAsset:
+        """
+        Pre-renderiza una página que referencia recursos vía asset_url()
+
+        Args:
+            render: Función de render del template (Template.render)
+            cache_control: Header Cache-Control de la página
+
+        Returns:
+            StaticAsset del HTML ya renderizado y comprimido
+        """
+        html = render(asset_url=self.url_for)
+        return StaticAsset(html.encode('utf-8'), "text/html", cache_control)